@@ -0,0 +1,214 @@
+"""Batch evaluation and analysis of large FEN/EPD files with NumPy.
+
+    python batch.py positions.epd --out labels.csv
+    python batch.py positions.fen --out labels.npy --depth 4 --workers 8
+
+Positions are read in chunks and encoded as int8 arrays, either one signed
+piece code per square (N, 64) or one-hot piece planes (N, 12, 64). The
+tapered material and piece-square evaluation is then computed for the whole
+chunk at once with the same tables Position.evaluate uses, optionally
+followed by a fixed-depth search per position across a process pool.
+Results are streamed to CSV or NPY, so memory use does not grow with the
+file.
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from engine import (BLACK, DEFAULT_HASH_MB, EG_SCORES, MG_SCORES, PHASE_WEIGHTS, PIECE_LETTERS,
+                    TOTAL_PHASE, WHITE, Engine, Position, move_to_uci)
+
+CHUNK_SIZE = 65536  # Positions encoded and evaluated per batch
+
+# Square codes: 0 empty, 1..6 a white pawn..king, -1..-6 a black one
+PIECE_CODES = np.zeros(256, dtype=np.int8)
+for _piece_type, _letter in enumerate(PIECE_LETTERS):
+    PIECE_CODES[ord(_letter.upper())] = _piece_type + 1
+    PIECE_CODES[ord(_letter)] = -(_piece_type + 1)
+_EXPAND_DIGITS = str.maketrans({str(n): '.' * n for n in range(1, 9)} | {'/': ''})
+
+# Planes are ordered white pawn..king, then black pawn..king
+PLANE_CODES = np.array([t + 1 for t in range(6)] + [-(t + 1) for t in range(6)], dtype=np.int8)
+
+
+def _weights_by_code(scores):
+    """Signed (material + square bonus) per square code + 6 and square, White positive"""
+    table = np.zeros((13, 64), dtype=np.int32)
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        for piece_type in range(6):
+            table[6 + sign * (piece_type + 1)] = scores[color][piece_type]
+    return table
+
+
+MG_WEIGHTS = _weights_by_code(MG_SCORES)
+EG_WEIGHTS = _weights_by_code(EG_SCORES)
+PHASE_BY_CODE = np.array([PHASE_WEIGHTS[abs(code) - 1] if code else 0 for code in range(-6, 7)], dtype=np.int32)
+SQUARE_INDEX = np.arange(64)
+
+
+def normalize_fen(line):
+    """A full FEN from a FEN or EPD line (EPD has no move counters and may carry opcodes)"""
+    fields = line.split()
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return ' '.join(fields[:6])
+    return ' '.join(fields[:4]) + ' 0 1'
+
+
+def read_fens(path):
+    """Yield one full FEN per non-empty, non-comment line of path"""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield normalize_fen(line)
+
+
+def encode_squares(fens):
+    """(N, 64) int8 signed piece codes, square 0 = a8 as everywhere in the engine"""
+    boards = [fen.split(' ', 1)[0].translate(_EXPAND_DIGITS) for fen in fens]
+    for index, board in enumerate(boards):
+        if len(board) != 64:
+            raise ValueError(f'bad board in FEN: {fens[index]}')
+    raw = np.frombuffer(''.join(boards).encode('ascii'), dtype=np.uint8).reshape(len(boards), 64)
+    return PIECE_CODES[raw]
+
+
+def encode_planes(fens):
+    """(N, 12, 64) int8 one-hot piece planes"""
+    return squares_to_planes(encode_squares(fens))
+
+
+def squares_to_planes(squares):
+    return (squares[:, None, :] == PLANE_CODES[None, :, None]).astype(np.int8)
+
+
+def planes_to_squares(planes):
+    return np.tensordot(planes, PLANE_CODES, axes=([1], [0])).astype(np.int8)
+
+
+def evaluate_batch(boards):
+    """Position.evaluate for every board at once, White positive (int32, shape (N,))
+
+    boards is either the (N, 64) square-code or the (N, 12, 64) plane encoding.
+    """
+    squares = planes_to_squares(boards) if boards.ndim == 3 else boards
+    rows = squares.astype(np.intp) + 6
+    mg = MG_WEIGHTS[rows, SQUARE_INDEX].sum(axis=1)
+    eg = EG_WEIGHTS[rows, SQUARE_INDEX].sum(axis=1)
+    phase = np.minimum(PHASE_BY_CODE[rows].sum(axis=1), TOTAL_PHASE)
+    return ((mg * phase + eg * (TOTAL_PHASE - phase)) // TOTAL_PHASE).astype(np.int32)
+
+
+_worker_engine = None
+
+
+def _init_worker(hash_mb):
+    global _worker_engine
+    _worker_engine = Engine(hash_mb=hash_mb)
+
+
+def _search_fen(fen, depth):
+    """Fixed-depth search of one position: (score White positive, best move)"""
+    _worker_engine.position = Position.from_fen(fen)
+    score, move = _worker_engine.search(depth)
+    if _worker_engine.position.side == BLACK:
+        score = -score
+    return score, move or 0
+
+
+def search_batch(fens, depth, pool):
+    """Search every position to depth on pool; returns (scores, moves) arrays"""
+    results = list(pool.map(_search_fen, fens, [depth] * len(fens), chunksize=max(1, len(fens) // 256)))
+    scores = np.array([score for score, _ in results], dtype=np.int32)
+    moves = np.array([move for _, move in results], dtype=np.uint16)
+    return scores, moves
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def label_file(path, out_path, depth=0, workers=1, planes=False, hash_mb=DEFAULT_HASH_MB):
+    """Evaluate (and with depth > 0, search) every position in path, streaming to CSV or NPY
+
+    The NPY output is a structured array with the encoded board, the static
+    evaluation and, when searching, the search score and best move (as the
+    engine's 16-bit move encoding). Scores are centipawns from White's side.
+    """
+    npy = out_path.endswith('.npy')
+    board_shape = (12, 64) if planes else (64,)
+    fields = [('board', np.int8, board_shape), ('eval', np.int32)]
+    if depth:
+        fields += [('score', np.int32), ('move', np.uint16)]
+
+    pool = None
+    if depth:
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(hash_mb,))
+    if npy:
+        total = sum(1 for _ in read_fens(path))  # The header needs the row count up front
+        out = open_memmap(out_path, mode='w+', dtype=np.dtype(fields), shape=(total,))
+    else:
+        out_file = open(out_path, 'w', newline='')
+        writer = csv.writer(out_file)
+        writer.writerow(['fen', 'eval'] + (['score', 'move'] if depth else []))
+
+    count = 0
+    try:
+        for fens in _chunks(read_fens(path), CHUNK_SIZE):
+            squares = encode_squares(fens)
+            evals = evaluate_batch(squares)
+            if depth:
+                scores, moves = search_batch(fens, depth, pool)
+            if npy:
+                rows = out[count:count + len(fens)]
+                rows['board'] = squares_to_planes(squares) if planes else squares
+                rows['eval'] = evals
+                if depth:
+                    rows['score'] = scores
+                    rows['move'] = moves
+            elif depth:
+                writer.writerows(zip(fens, evals.tolist(), scores.tolist(),
+                                     [move_to_uci(move) if move else '' for move in moves.tolist()]))
+            else:
+                writer.writerows(zip(fens, evals.tolist()))
+            count += len(fens)
+    finally:
+        if npy:
+            out.flush()
+            del out
+        else:
+            out_file.close()
+        if pool is not None:
+            pool.shutdown()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate or search every position in a FEN/EPD file')
+    parser.add_argument('positions', help='FEN or EPD file, one position per line')
+    parser.add_argument('--out', required=True, help='output .csv or .npy file')
+    parser.add_argument('--depth', type=int, default=0, help='also search each position to this depth')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='search processes')
+    parser.add_argument('--hash', type=int, default=DEFAULT_HASH_MB, help='transposition table MB per process')
+    parser.add_argument('--planes', action='store_true', help='store (12, 64) piece planes instead of (64,) codes')
+    args = parser.parse_args()
+    count = label_file(args.positions, args.out, args.depth, args.workers, args.planes, args.hash)
+    print(f'{count} positions written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
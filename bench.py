@@ -0,0 +1,145 @@
+"""Move generator correctness (perft) and search speed (nodes per second) checks.
+
+    python bench.py perft                 # the whole suite against known counts
+    python bench.py perft --depth 5 --divide --fen "<fen>"
+    python bench.py search --depth 5      # fixed-position search benchmark
+    python bench.py search --depth 5 --disable null_move   # ... without one search feature
+"""
+
+import argparse
+import sys
+import time
+
+from engine import SEARCH_FEATURES, Engine, Position, START_FEN, move_to_uci
+
+# Standard perft positions with their published leaf counts per depth
+PERFT_SUITE = [
+    ('startpos', START_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ('promotions', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('talkchess', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+]
+
+# Positions for the search benchmark: opening, middlegame, tactics, endgame
+BENCH_FENS = [
+    START_FEN,
+    'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+    'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+]
+
+
+def perft(position, depth):
+    """Count the leaf nodes of the legal move tree to the given depth"""
+    moves = position.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def divide(position, depth):
+    """Perft split by root move, for tracking down a miscounting move"""
+    counts = {}
+    for move in position.legal_moves():
+        position.make_move(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return counts
+
+
+def run_perft(fen, depth, show_divide=False):
+    position = Position.from_fen(fen)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(position, depth)
+        for move, count in sorted(counts.items()):
+            print(f'{move}: {count}')
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(position, depth)
+    elapsed = time.perf_counter() - start
+    print(f'perft {depth}: {nodes} nodes in {elapsed:.2f}s ({nodes / max(elapsed, 1e-9):.0f} nps)')
+    return nodes
+
+
+def run_perft_suite(max_depth):
+    """Check every suite position up to max_depth; returns True if all counts match"""
+    all_ok = True
+    total_nodes, total_time = 0, 0.0
+    for name, fen, expected in PERFT_SUITE:
+        for depth in sorted(expected):
+            if depth > max_depth:
+                break
+            start = time.perf_counter()
+            nodes = perft(Position.from_fen(fen), depth)
+            elapsed = time.perf_counter() - start
+            total_nodes, total_time = total_nodes + nodes, total_time + elapsed
+            ok = nodes == expected[depth]
+            all_ok = all_ok and ok
+            print(f'{name:<11} depth {depth}: {nodes:>9} {"ok" if ok else "FAIL (expected %d)" % expected[depth]}'
+                  f'  {elapsed:6.2f}s')
+    print(f'total: {total_nodes} nodes in {total_time:.2f}s ({total_nodes / max(total_time, 1e-9):.0f} nps)')
+    return all_ok
+
+
+def run_search_bench(max_depth, hash_mb, workers=1, disabled=()):
+    """Search each benchmark position to each depth from an empty table, with the disabled search features off"""
+    print(f'{"pos":>3} {"depth":>5} {"nodes":>9} {"time":>7} {"nps":>7}  best')
+    total_nodes, total_time = 0, 0.0
+    for index, fen in enumerate(BENCH_FENS):
+        for depth in range(1, max_depth + 1):
+            engine = Engine(Position.from_fen(fen), hash_mb=hash_mb, workers=workers)
+            for feature in disabled:
+                setattr(engine, feature, False)
+            start = time.perf_counter()
+            score, move = engine.search(depth)
+            elapsed = time.perf_counter() - start
+            engine.close()
+            total_nodes, total_time = total_nodes + engine.nodes, total_time + elapsed
+            print(f'{index:>3} {depth:>5} {engine.nodes:>9} {elapsed:>6.2f}s {engine.nodes / max(elapsed, 1e-9):>7.0f}'
+                  f'  {move_to_uci(move) if move is not None else "-"} ({score})')
+    print(f'total: {total_nodes} nodes in {total_time:.2f}s ({total_nodes / max(total_time, 1e-9):.0f} nps)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perft and search benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    perft_parser = subparsers.add_parser('perft', help='count move-tree leaves')
+    perft_parser.add_argument('--fen', help='position to count (default: run the known-count suite)')
+    perft_parser.add_argument('--depth', type=int, default=3)
+    perft_parser.add_argument('--divide', action='store_true', help='print counts per root move')
+
+    search_parser = subparsers.add_parser('search', help='nodes, time and NPS per depth')
+    search_parser.add_argument('--depth', type=int, default=4)
+    search_parser.add_argument('--hash', type=int, default=16, help='transposition table size in MB')
+    search_parser.add_argument('--threads', type=int, default=1, help='worker processes')
+    search_parser.add_argument('--disable', action='append', default=[], choices=SEARCH_FEATURES,
+                               help='turn a selective search feature off (repeatable)')
+
+    args = parser.parse_args()
+    if args.command == 'perft':
+        if args.fen:
+            run_perft(args.fen, args.depth, args.divide)
+        elif not run_perft_suite(args.depth):
+            sys.exit(1)
+    else:
+        run_search_bench(args.depth, args.hash, args.threads, args.disable)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+"""Win/draw/loss bitbases for endgames of up to four pieces, built by retrograde analysis.
+
+    python bitbase.py --out bitbases                  # every 3- and 4-piece table
+    python bitbase.py --out bitbases --pieces 3       # only up to 3 pieces (seconds)
+    python bitbase.py --out bitbases KQvKR KPvK       # these, plus what they convert into
+
+A table covers one material balance, such as KQvKR, always with the
+stronger side as White. It holds a 2-bit result for every placement of the
+pieces with either side to move: draw, win or loss for the side to move,
+or illegal. Entries are indexed by the side to move and then each piece's
+square (kings first, then White's pieces, then Black's, queens before
+pawns), four to a byte and without symmetry folding, so a 4-piece table is
+2 * 64**4 / 4 bytes = 8 MB. Probing memory-maps the files and reads one
+byte. Positions with castling rights or an en passant square are never
+probed, since the tables don't know about either.
+
+The generator holds a table as a NumPy array with one axis per piece, so
+moving a piece from one square to another is a broadcast between two
+slices of it. Every position first counts its moves that stay in the
+table and looks up the ones that leave it (captures and promotions, in
+smaller tables built beforehand); then results spread backwards from the
+decided positions until nothing changes, and whatever is left is a draw.
+"""
+
+import argparse
+import itertools
+import mmap
+import os
+import time
+
+import numpy as np
+
+from engine import BISHOP, BLACK, KING, KNIGHT, PAWN, PIECE_LETTERS, PIECE_VALUES, QUEEN, ROOK, WHITE
+
+# Stored values, from the side to move's point of view
+DRAW, WIN, LOSS, ILLEGAL = range(4)
+PROBE_RESULTS = (0, 1, -1, None)  # What probe() returns for each stored value
+MAX_PIECES = 4
+TABLE_SUFFIX = '.bb'
+PIECE_ORDER = (QUEEN, ROOK, BISHOP, KNIGHT, PAWN)  # Order of the non-king pieces in names and indexes
+PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+KNIGHT_STEPS = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2))
+SLIDER_DIRECTIONS = {
+    BISHOP: ((1, 1), (1, -1), (-1, 1), (-1, -1)),
+    ROOK: ((0, 1), (0, -1), (1, 0), (-1, 0)),
+}
+SLIDER_DIRECTIONS[QUEEN] = SLIDER_DIRECTIONS[BISHOP] + SLIDER_DIRECTIONS[ROOK]
+
+
+def table_name(white, black):
+    """'KQvKR' from each side's non-king piece types"""
+    return ('K' + ''.join(PIECE_LETTERS[t].upper() for t in white)
+            + 'vK' + ''.join(PIECE_LETTERS[t].upper() for t in black))
+
+
+def parse_table_name(name):
+    """(white, black) non-king piece types from a table name"""
+    sides = name.upper().split('V')
+    if len(sides) != 2 or not all(side.startswith('K') for side in sides):
+        raise ValueError(f'bad table name: {name!r} (expected something like KQvKR)')
+    return tuple(tuple(sorted((PIECE_LETTERS.index(letter.lower()) for letter in side[1:]), reverse=True))
+                 for side in sides)
+
+
+def canonical(white, black):
+    """(white, black, flipped): the side with more material is White in every table"""
+    white, black = tuple(sorted(white, reverse=True)), tuple(sorted(black, reverse=True))
+    if (sum(PIECE_VALUES[t] for t in black), black) > (sum(PIECE_VALUES[t] for t in white), white):
+        return black, white, True
+    return white, black, False
+
+
+def table_slots(white, black):
+    """(color, piece type) of each axis of a table"""
+    return (((WHITE, KING), (BLACK, KING)) + tuple((WHITE, t) for t in white)
+            + tuple((BLACK, t) for t in black))
+
+
+def all_tables(max_pieces=MAX_PIECES):
+    """Names of every table with at most max_pieces pieces, smallest first"""
+    names = []
+    for extra in range(max_pieces - 1):
+        for pieces in itertools.combinations_with_replacement(PIECE_ORDER, extra):
+            for split in range(len(pieces) + 1):
+                for white in set(itertools.combinations(pieces, split)):
+                    black = list(pieces)
+                    for piece in white:
+                        black.remove(piece)
+                    name = table_name(*canonical(white, black)[:2])
+                    if name not in names:
+                        names.append(name)
+    return names
+
+
+class Bitbases:
+    """Every table in a directory, memory-mapped for probing during search"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}  # (white types, black types) -> mmap of the packed table
+        self.max_pieces = 0
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(TABLE_SUFFIX):
+                continue
+            white, black = parse_table_name(filename[:-len(TABLE_SUFFIX)])
+            with open(os.path.join(directory, filename), 'rb') as f:
+                self.tables[white, black] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.max_pieces = max(self.max_pieces, 2 + len(white) + len(black))
+
+    def __len__(self):
+        return len(self.tables)
+
+    def probe(self, position):
+        """1, 0 or -1 for a win, draw or loss for the side to move, or None if no table has it"""
+        if position.castling or position.ep_square is not None:
+            return None
+        if bin(position.occupied[WHITE] | position.occupied[BLACK]).count('1') > self.max_pieces:
+            return None
+        pieces = ([], [])  # Non-king (type, square) per color, in table order
+        for color in (WHITE, BLACK):
+            boards = position.bitboards[color]
+            for piece_type in PIECE_ORDER:
+                board = boards[piece_type]
+                while board:
+                    low = board & -board
+                    pieces[color].append((piece_type, low.bit_length() - 1))
+                    board ^= low
+        white = tuple(t for t, _ in pieces[WHITE])
+        black = tuple(t for t, _ in pieces[BLACK])
+        flipped = False
+        table = self.tables.get((white, black))
+        if table is None:
+            flipped = True
+            table = self.tables.get((black, white))
+            if table is None:
+                return None
+        strong, weak = (BLACK, WHITE) if flipped else (WHITE, BLACK)
+        mirror = 56 if flipped else 0  # Colors swapped means the board is turned upside down too
+        index = position.side ^ flipped
+        for sq in ([position.king_squares[strong], position.king_squares[weak]]
+                   + [sq for _, sq in pieces[strong]] + [sq for _, sq in pieces[weak]]):
+            index = index * 64 + (sq ^ mirror)
+        return PROBE_RESULTS[table[index >> 2] >> ((index & 3) << 1) & 3]
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+
+
+# Board geometry for the generator, as (64,) and (64, 64) arrays
+
+def _on_board(row, col):
+    return 0 <= row < 8 and 0 <= col < 8
+
+
+def _step_targets(sq, steps):
+    row, col = divmod(sq, 8)
+    return [(row + dr) * 8 + col + dc for dr, dc in steps if _on_board(row + dr, col + dc)]
+
+
+def _rays(sq, directions):
+    """For each direction, the squares along it as (square, squares passed on the way)"""
+    row, col = divmod(sq, 8)
+    for dr, dc in directions:
+        passed = []
+        r, c = row + dr, col + dc
+        while _on_board(r, c):
+            yield r * 8 + c, tuple(passed)
+            passed.append(r * 8 + c)
+            r, c = r + dr, c + dc
+
+
+def _piece_moves(color, piece_type):
+    """(from, to, squares that must be empty, quiet allowed, capture allowed, promotes) per move"""
+    moves = []
+    for sq in range(64):
+        if piece_type == PAWN:
+            row, col = divmod(sq, 8)
+            if row in (0, 7):
+                continue
+            forward = -1 if color == WHITE else 1
+            last_row = 0 if color == WHITE else 7
+            ahead = sq + 8 * forward
+            moves.append((sq, ahead, (), True, False, ahead // 8 == last_row))
+            if row == (6 if color == WHITE else 1):
+                moves.append((sq, ahead + 8 * forward, (ahead,), True, False, False))
+            for dc in (-1, 1):
+                if _on_board(row + forward, col + dc):
+                    moves.append((sq, ahead + dc, (), False, True, ahead // 8 == last_row))
+        elif piece_type in (KING, KNIGHT):
+            for target in _step_targets(sq, KING_STEPS if piece_type == KING else KNIGHT_STEPS):
+                moves.append((sq, target, (), True, True, False))
+        else:
+            for target, passed in _rays(sq, SLIDER_DIRECTIONS[piece_type]):
+                moves.append((sq, target, passed, True, True, False))
+    return moves
+
+
+def _attack_table(color, piece_type):
+    """[from, to]: whether the piece attacks to from from on an empty board"""
+    table = np.zeros((64, 64), dtype=bool)
+    for from_sq, to_sq, _, _, may_capture, _ in _piece_moves(color, piece_type):
+        if may_capture:
+            table[from_sq, to_sq] = True
+    return table
+
+
+def _between_table():
+    """[a, b, c]: whether c lies strictly between a and b on a rank, file or diagonal"""
+    table = np.zeros((64, 64, 64), dtype=bool)
+    for sq in range(64):
+        for target, passed in _rays(sq, SLIDER_DIRECTIONS[QUEEN]):
+            table[sq, target, list(passed)] = True
+    return table
+
+
+MIRROR = np.arange(64) ^ 56
+SQUARES = np.arange(64)
+DISTINCT = ~np.eye(64, dtype=bool)
+PAWN_ROW_OK = (SQUARES >= 8) & (SQUARES < 56)
+BETWEEN = _between_table()
+# A win for the side moving into a position is a loss for the side then to
+# move there, and so on: what a move is worth to the mover, -1 for illegal
+MOVER_RESULT = np.array([1, 0, 2, -1], dtype=np.int8)  # 2 win, 1 draw, 0 loss
+
+
+def _place(table, axes, ndim):
+    """Reshape table, whose dimensions belong to the given axes, to broadcast over ndim axes"""
+    order = np.argsort(axes)
+    shape = [1] * ndim
+    for axis in axes:
+        shape[axis] = 64
+    return table.transpose(order).reshape(shape)
+
+
+def _fix(axes_values, ndim):
+    """Index picking the slice with each given axis fixed at a square"""
+    index = [slice(None)] * ndim
+    for axis, sq in axes_values:
+        index[axis] = sq
+    return tuple(index)
+
+
+def _outer(vectors):
+    """All-of over one (64,) bool vector per axis"""
+    result = np.ones((64,) * len(vectors), dtype=bool)
+    for axis, vector in enumerate(vectors):
+        result &= _place(vector, (axis,), len(vectors))
+    return result
+
+
+class Generator:
+    """Builds tables into a directory, along with every table they depend on"""
+
+    def __init__(self, directory, verbose=True):
+        self.directory = directory
+        self.verbose = verbose
+        self.tables = {}  # name -> unpacked (2, 64, ...) int8 values
+        self.views = {}
+        self.nested_time = 0.0  # Seconds the table being built has spent building the ones it needs
+        self.moves = {(color, t): _piece_moves(color, t) for color in (WHITE, BLACK) for t in range(6)}
+        self.attacks = {(color, t): _attack_table(color, t) for color in (WHITE, BLACK) for t in range(6)}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name + TABLE_SUFFIX)
+
+    def table(self, name):
+        """A table's values, loaded from disk or built (and saved) first"""
+        if name not in self.tables:
+            white, black = parse_table_name(name)
+            ndim = 2 + len(white) + len(black)
+            if os.path.exists(self.path(name)):
+                self.tables[name] = _unpack(np.fromfile(self.path(name), dtype=np.uint8), ndim)
+            else:
+                outer_nested, self.nested_time = self.nested_time, 0.0
+                start = time.perf_counter()
+                values = self._solve(white, black)
+                _pack(values).tofile(self.path(name))
+                self.tables[name] = values
+                elapsed = time.perf_counter() - start
+                if self.verbose:
+                    counts = np.bincount(values.ravel(), minlength=4)
+                    print(f'{name}: {counts[WIN]} wins, {counts[DRAW]} draws, {counts[LOSS]} losses '
+                          f'in {elapsed - self.nested_time:.1f}s')
+                self.nested_time = outer_nested + elapsed
+        return self.tables[name]
+
+    def _view(self, pieces, side):
+        """Values of the table holding pieces with side to move, one axis per piece in the order given"""
+        key = (pieces, side)
+        if key not in self.views:
+            white = [t for color, t in pieces if color == WHITE and t != KING]
+            black = [t for color, t in pieces if color == BLACK and t != KING]
+            white, black, flipped = canonical(white, black)
+            slots = table_slots(white, black)
+            used = []
+            for color, piece_type in pieces:
+                used.append(next(axis for axis, slot in enumerate(slots)
+                                 if slot == (color ^ flipped, piece_type) and axis not in used))
+            view = self.table(table_name(white, black))[side ^ flipped].transpose(used)
+            if flipped:
+                view = view[np.ix_(*[MIRROR] * len(pieces))]
+            self.views[key] = view
+        return self.views[key]
+
+    def _attacked(self, slots, target, color):
+        """Whether the piece in slot target is attacked by color's pieces, over every placement"""
+        ndim = len(slots)
+        attacked = np.zeros((64,) * ndim, dtype=bool)
+        for slot, (slot_color, piece_type) in enumerate(slots):
+            if slot_color != color:
+                continue
+            attack = _place(self.attacks[color, piece_type], (slot, target), ndim)
+            if piece_type in SLIDER_DIRECTIONS:
+                for other in range(ndim):
+                    if other not in (slot, target):
+                        attack = attack & ~_place(BETWEEN, (slot, target, other), ndim)
+            attacked |= attack
+        return attacked
+
+    def _legal(self, slots, side):
+        """Placements that are legal positions with side to move"""
+        ndim = len(slots)
+        legal = ~self._attacked(slots, side ^ 1, side)  # Slots 0 and 1 are the white and black kings
+        for a, b in itertools.combinations(range(ndim), 2):
+            legal &= _place(DISTINCT, (a, b), ndim)
+        for slot, (_, piece_type) in enumerate(slots):
+            if piece_type == PAWN:
+                legal &= _place(PAWN_ROW_OK, (slot,), ndim)
+        return legal
+
+    def _solve(self, white, black):
+        slots = table_slots(white, black)
+        ndim = len(slots)
+        legal = [self._legal(slots, side) for side in (WHITE, BLACK)]
+        in_check = [self._attacked(slots, side, side ^ 1) for side in (WHITE, BLACK)]
+        # Moves that stay in this table, and the best result among those that leave it
+        count = [np.zeros((64,) * ndim, dtype=np.int8) for _ in range(2)]
+        exits = [np.full((64,) * ndim, -1, dtype=np.int8) for _ in range(2)]
+        for side in (WHITE, BLACK):
+            for slot, piece in enumerate(slots):
+                if piece[0] == side:
+                    self._count_moves(slots, slot, side, legal, count[side], exits[side])
+
+        decided = [~legal[side] for side in (WHITE, BLACK)]
+        new_win, new_loss = [], []
+        for side in (WHITE, BLACK):
+            stuck = legal[side] & (count[side] == 0)
+            win = legal[side] & (exits[side] == 2)
+            loss = stuck & ~win & ((exits[side] == 0) | ((exits[side] == -1) & in_check[side]))
+            decided[side] |= win | stuck  # Stuck without a loss is stalemate or a drawn exit
+            new_win.append(win)
+            new_loss.append(loss)
+        values = [np.where(legal[side], DRAW, ILLEGAL).astype(np.int8) for side in (WHITE, BLACK)]
+
+        while any(a.any() for a in new_win + new_loss):
+            for side in (WHITE, BLACK):
+                values[side][new_win[side]] = WIN
+                values[side][new_loss[side]] = LOSS
+            wins, lost = [None, None], [None, None]
+            for side in (WHITE, BLACK):
+                # The side that moved into these positions is the one not to move in them
+                wins[side ^ 1], lost[side ^ 1] = self._predecessors(slots, side ^ 1, new_loss[side], new_win[side])
+            for mover in (WHITE, BLACK):
+                open_ = ~decided[mover]
+                new_win[mover] = wins[mover] & open_
+                count[mover] -= lost[mover]
+                stuck = open_ & ~new_win[mover] & (count[mover] == 0)
+                new_loss[mover] = stuck & (exits[mover] != 1)
+                decided[mover] |= new_win[mover] | stuck
+        return np.stack(values)
+
+    def _count_moves(self, slots, slot, side, legal, count, exits):
+        ndim = len(slots)
+        color, piece_type = slots[slot]
+        others = [other for other in range(ndim) if other != slot]
+        enemies = [other for other in others if slots[other][0] != side and slots[other][1] != KING]
+        for from_sq, to_sq, passed, may_quiet, may_capture, promotes in self.moves[color, piece_type]:
+            clear = np.ones(64, dtype=bool)
+            clear[list(passed)] = False
+            source = _fix([(slot, from_sq)], ndim)
+            if may_quiet:
+                empty = clear & (SQUARES != to_sq)
+                mask = _outer([empty] * len(others))
+                if promotes:
+                    for promoted in PROMOTIONS:
+                        pieces = slots[:slot] + ((color, promoted),) + slots[slot + 1:]
+                        results = MOVER_RESULT[self._view(pieces, side ^ 1)[_fix([(slot, to_sq)], ndim)]]
+                        np.maximum(exits[source], np.where(mask, results, -1), out=exits[source])
+                else:
+                    count[source] += mask & legal[side ^ 1][_fix([(slot, to_sq)], ndim)]
+            if not may_capture:
+                continue
+            for enemy in enemies:
+                # Positions with the captured piece on to_sq; the rest of the board must be clear
+                mask = _outer([clear] * (ndim - 2))
+                where = _fix([(slot, from_sq), (enemy, to_sq)], ndim)
+                left = slots[:enemy] + slots[enemy + 1:]
+                moved = slot if slot < enemy else slot - 1
+                for promoted in (PROMOTIONS if promotes else (piece_type,)):
+                    pieces = left[:moved] + ((color, promoted),) + left[moved + 1:]
+                    results = MOVER_RESULT[self._view(pieces, side ^ 1)[_fix([(moved, to_sq)], ndim - 1)]]
+                    np.maximum(exits[where], np.where(mask, results, -1), out=exits[where])
+
+    def _predecessors(self, slots, mover, losses, wins):
+        """For positions that mover's moves lead into (mover not to move in them): where
+        mover could have come from a loss (so wins there), and how many moves into wins"""
+        ndim = len(slots)
+        win = np.zeros((64,) * ndim, dtype=bool)
+        lost = np.zeros((64,) * ndim, dtype=np.int8)
+        for slot, (color, piece_type) in enumerate(slots):
+            if color != mover:
+                continue
+            reverse = {}
+            for from_sq, to_sq, passed, may_quiet, _, promotes in self.moves[color, piece_type]:
+                if may_quiet and not promotes:
+                    reverse.setdefault(to_sq, []).append((from_sq, passed))
+            for to_sq, origins in reverse.items():
+                after = _fix([(slot, to_sq)], ndim)
+                loss_slice, win_slice = losses[after], wins[after]
+                any_loss, any_win = loss_slice.any(), win_slice.any()
+                if not any_loss and not any_win:
+                    continue
+                for from_sq, passed in origins:
+                    empty = SQUARES != from_sq
+                    empty[list(passed)] = False
+                    mask = _outer([empty] * (ndim - 1))
+                    before = _fix([(slot, from_sq)], ndim)
+                    if any_loss:
+                        win[before] |= loss_slice & mask
+                    if any_win:
+                        lost[before] += win_slice & mask
+        return win, lost
+
+
+def _pack(values):
+    flat = values.ravel().astype(np.uint8)
+    return flat[0::4] | flat[1::4] << 2 | flat[2::4] << 4 | flat[3::4] << 6
+
+
+def _unpack(packed, ndim):
+    values = np.empty(packed.size * 4, dtype=np.int8)
+    for part in range(4):
+        values[part::4] = packed >> (2 * part) & 3
+    return values.reshape((2,) + (64,) * ndim)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build endgame bitbases by retrograde analysis')
+    parser.add_argument('tables', nargs='*', help='table names such as KQvKR (default: all)')
+    parser.add_argument('--out', default='bitbases', help='directory for the .bb files')
+    parser.add_argument('--pieces', type=int, default=MAX_PIECES, choices=range(2, MAX_PIECES + 1),
+                        help='with no names given, build every table with at most this many pieces')
+    args = parser.parse_args()
+    generator = Generator(args.out)
+    names = args.tables or all_tables(args.pieces)
+    for name in names:
+        generator.table(table_name(*canonical(*parse_table_name(name))[:2]))
+    print(f'{len(names)} tables in {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Polyglot (.bin) opening book lookup.
+
+A Polyglot book is a flat file of 16-byte big-endian entries (key, move,
+weight, learn) sorted by key, where key is the position's Zobrist key (the
+same one as Position.key). The file is memory-mapped and binary-searched, so
+opening even a huge book costs no load time and only the pages a lookup
+touches are ever read in.
+"""
+
+import mmap
+import os
+import random
+import struct
+
+from engine import KING, KING_CASTLE, QUEEN_CASTLE, move_from, move_to, promotion_piece
+
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+
+
+def polyglot_square(index):
+    """Polyglot numbers squares a1=0..h8=63; ours run a8=0..h1=63"""
+    return ((7 - (index >> 3)) << 3) | (index & 7)
+
+
+class OpeningBook:
+    """A memory-mapped Polyglot opening book"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self.count = size // ENTRY.size
+        # mmap refuses empty files; an empty book simply never has a move
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def entries(self, key):
+        """(polyglot_move, weight) for every entry stored under key"""
+        low, high = 0, self.count
+        while low < high:  # Find the first entry with this key
+            mid = (low + high) // 2
+            if KEY.unpack_from(self._map, mid * ENTRY.size)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        found = []
+        for index in range(low, self.count):
+            entry_key, move, weight, _ = ENTRY.unpack_from(self._map, index * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((move, weight))
+        return found
+
+    def moves(self, position):
+        """Book moves for position as (move, weight), translated to engine moves"""
+        if self._map is None:
+            return []
+        legal = {}
+        for move in position.legal_moves():
+            legal[(move_from(move), move_to(move), promotion_piece(move) or 0)] = move
+        result = []
+        for book_move, weight in self.entries(position.key):
+            from_sq = polyglot_square((book_move >> 6) & 63)
+            to_sq = polyglot_square(book_move & 63)
+            promoted = (book_move >> 12) & 7  # 1-4 = knight..queen, our piece numbers too
+            piece = position.squares[from_sq]
+            if piece is not None and piece[1] == KING and abs(to_sq - from_sq) in (3, 4):
+                # Polyglot writes castling as the king taking its own rook
+                to_sq = from_sq + 2 if to_sq > from_sq else from_sq - 2
+            move = legal.get((from_sq, to_sq, promoted))
+            if move is not None:
+                result.append((move, weight))
+        return result
+
+    def choose(self, position, rng=random):
+        """Pick a book move at random, weighted by the book, or None when out of book"""
+        candidates = [(move, weight) for move, weight in self.moves(position) if weight > 0]
+        if not candidates:
+            return None
+        return rng.choices([move for move, _ in candidates], [weight for _, weight in candidates])[0]
+
+
+def write_book(path, entries):
+    """Write (key, engine_move, weight) entries as a Polyglot book, for building small books"""
+    packed = sorted((key, to_polyglot_move(move), weight) for key, move, weight in entries)
+    with open(path, 'wb') as f:
+        for key, move, weight in packed:
+            f.write(ENTRY.pack(key, move, weight, 0))
+
+
+def to_polyglot_move(move):
+    """Encode an engine move the way Polyglot stores it"""
+    from_sq, to_sq = move_from(move), move_to(move)
+    flags = move >> 12
+    if flags in (KING_CASTLE, QUEEN_CASTLE):  # Castling: king "captures" its rook
+        to_sq = to_sq + 1 if flags == KING_CASTLE else to_sq - 2
+    promoted = promotion_piece(move) or 0
+    return polyglot_square(to_sq) | (polyglot_square(from_sq) << 6) | (promoted << 12)
@@ -0,0 +1,101 @@
+"""Persistent analysis cache shared across sessions and processes.
+
+Search results (depth, score, best move) are kept in a small SQLite database
+keyed by position key. SQLite's write-ahead log lets any number of engine
+processes read at once while one writes. Lookups never write: the keys they
+hit are remembered and their last-used time is brought up to date with the
+next store, and the least recently used positions are evicted once the
+cache grows past max_entries.
+"""
+
+import sqlite3
+import time
+
+DEFAULT_MAX_ENTRIES = 1000000
+EVICT_EVERY = 64  # Stores between size checks
+TOUCH_BATCH = 500  # Keys per last_used update, well under SQLite's parameter limit
+
+
+def _signed(key):
+    """SQLite integers are signed 64-bit; Zobrist keys are unsigned"""
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+def _unsigned(key):
+    return key + (1 << 64) if key < 0 else key
+
+
+class AnalysisCache:
+    """On-disk table of completed searches, keyed by Position.key"""
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._stores = 0
+        self._touched = set()  # Signed keys looked up since the last write, for last_used
+        # The GUI searches on a background thread; one search uses the cache at a time
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS positions ('
+                         'key INTEGER PRIMARY KEY, depth INTEGER, score INTEGER, move INTEGER, last_used REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS positions_last_used ON positions (last_used)')
+
+    def close(self):
+        try:
+            self._touch()
+        except sqlite3.OperationalError:
+            pass
+        self._db.close()
+
+    def lookup_many(self, keys):
+        """{key: (depth, score, move)} for the keys that are cached"""
+        keys = [_signed(key) for key in keys]
+        if not keys:
+            return {}
+        marks = ','.join('?' * len(keys))
+        rows = self._db.execute(f'SELECT key, depth, score, move FROM positions WHERE key IN ({marks})',
+                                keys).fetchall()
+        self._touched.update(row[0] for row in rows)
+        return {_unsigned(key): (depth, score, move) for key, depth, score, move in rows}
+
+    def lookup(self, key):
+        return self.lookup_many([key]).get(key)
+
+    def store(self, key, depth, score, move):
+        """Record a search result, keeping whichever of old and new went deeper"""
+        try:
+            self._db.execute(
+                'INSERT INTO positions VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                'depth = excluded.depth, score = excluded.score, move = excluded.move, '
+                'last_used = excluded.last_used WHERE excluded.depth >= positions.depth',
+                (_signed(key), depth, score, move, time.time()))
+            self._touch()
+            self._stores += 1
+            if self._stores % EVICT_EVERY == 0:
+                self.evict()
+        except sqlite3.OperationalError:
+            pass  # Locked for longer than the timeout: losing one entry is fine
+
+    def _touch(self):
+        """Write out the last-used time of the positions looked up since the last write"""
+        if not self._touched:
+            return
+        keys = list(self._touched)
+        now = time.time()
+        for start in range(0, len(keys), TOUCH_BATCH):
+            batch = keys[start:start + TOUCH_BATCH]
+            self._db.execute(f'UPDATE positions SET last_used = ? WHERE key IN ({",".join("?" * len(batch))})',
+                             [now] + batch)
+        self._touched.clear()
+
+    def evict(self):
+        """Drop the least recently used positions beyond max_entries"""
+        count = self._db.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute('DELETE FROM positions WHERE key IN '
+                             '(SELECT key FROM positions ORDER BY last_used LIMIT ?)',
+                             (count - self.max_entries,))
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
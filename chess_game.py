@@ -1,10 +1,16 @@
-import pygame
+import argparse
+import json
+import os
 import sys
-import threading
 import time
 
-# Initialize Pygame
-pygame.init()
+if '--uci' in sys.argv:
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'  # stdout belongs to the UCI protocol
+import pygame
+
+import engine
+from history import GameHistory, game_over
+from search_process import SearchProcess
 
 # Screen dimensions and colors
 SCREEN_WIDTH = 800
@@ -24,445 +30,407 @@ RED = (255, 0, 0)
 BLUE = (0, 0, 255)
 TRANSPARENT_GREEN = (100, 249, 83, 128)
 
+# Rendering: only changed squares are redrawn, and an idle window sleeps
+IDLE_WAIT_MS = 250  # Longest an idle window sleeps before looking at the game again
+TEXT_CACHE_SIZE = 256  # Rendered strings kept; live stats would otherwise grow it forever
+
 # AI settings
 MIN_AI_DEPTH = 1
 MAX_AI_DEPTH = 5
 AI_DEPTH = 2  # Default difficulty
+# Think-time budget per difficulty level; the search stops at whichever of
+# depth or time runs out first, so a busy middlegame can't stall the game
+AI_MOVETIME_MS = {1: 250, 2: 500, 3: 1000, 4: 2000, 5: 4000}
 
-class ChessPiece:
-    def __init__(self, color, piece_type, position):
-        self.color = color
-        self.piece_type = piece_type
-        self.position = position
-        self.has_moved = False
-        self.en_passant_vulnerable = False
-
-    def draw(self, screen, x, y):
-        """Draw the piece directly on the screen"""
-        piece_color = WHITE if self.color == 'white' else BLACK
-        accent_color = GOLD if self.color == 'white' else SILVER
-        
-        if self.piece_type == 'pawn':
-            # Simple pawn - circle with a smaller circle on top
-            pygame.draw.circle(screen, piece_color, (x + SQUARE_SIZE//2, y + SQUARE_SIZE*3//5), SQUARE_SIZE//4)
-            pygame.draw.circle(screen, piece_color, (x + SQUARE_SIZE//2, y + SQUARE_SIZE//3), SQUARE_SIZE//6)
-        
-        elif self.piece_type == 'rook':
-            # Castle-like rook
-            pygame.draw.rect(screen, piece_color, (x + SQUARE_SIZE//4, y + SQUARE_SIZE//4, 
-                                                 SQUARE_SIZE//2, SQUARE_SIZE//2))
-            # Battlements
-            for i in range(3):
-                pygame.draw.rect(screen, piece_color, (x + SQUARE_SIZE//4 + i*(SQUARE_SIZE//6), 
-                                                     y + SQUARE_SIZE//6, SQUARE_SIZE//8, SQUARE_SIZE//4))
-        
-        elif self.piece_type == 'knight':
-            # Horse head shape
-            points = [(x + SQUARE_SIZE//4, y + SQUARE_SIZE*3//4), 
-                     (x + SQUARE_SIZE*3//4, y + SQUARE_SIZE*3//4),
-                     (x + SQUARE_SIZE*3//4, y + SQUARE_SIZE//3),
-                     (x + SQUARE_SIZE//2, y + SQUARE_SIZE//4),
-                     (x + SQUARE_SIZE//3, y + SQUARE_SIZE//2)]
-            pygame.draw.polygon(screen, piece_color, points)
-            # Eye
-            pygame.draw.circle(screen, accent_color, (x + SQUARE_SIZE*2//3, y + SQUARE_SIZE//2), 3)
-        
-        elif self.piece_type == 'bishop':
-            # Bishop hat shape
-            points = [(x + SQUARE_SIZE//2, y + SQUARE_SIZE//4), 
-                     (x + SQUARE_SIZE*3//4, y + SQUARE_SIZE*3//4),
-                     (x + SQUARE_SIZE//4, y + SQUARE_SIZE*3//4)]
-            pygame.draw.polygon(screen, piece_color, points)
-            # Cross
-            pygame.draw.rect(screen, accent_color, (x + SQUARE_SIZE*7//16, y + SQUARE_SIZE//4, 
-                                                  SQUARE_SIZE//8, SQUARE_SIZE//4))
-        
-        elif self.piece_type == 'queen':
-            # Crown shape
-            points = [(x + SQUARE_SIZE//4, y + SQUARE_SIZE*3//4),
-                     (x + SQUARE_SIZE*3//4, y + SQUARE_SIZE*3//4),
-                     (x + SQUARE_SIZE*2//3, y + SQUARE_SIZE//3),
-                     (x + SQUARE_SIZE//2, y + SQUARE_SIZE//2),
-                     (x + SQUARE_SIZE//3, y + SQUARE_SIZE//3)]
-            pygame.draw.polygon(screen, piece_color, points)
-            # Crown points
-            for i in range(3):
-                pygame.draw.circle(screen, accent_color, 
-                                 (x + SQUARE_SIZE//3 + i*(SQUARE_SIZE//6), y + SQUARE_SIZE//3), 4)
-        
-        elif self.piece_type == 'king':
-            # Base
-            pygame.draw.rect(screen, piece_color, (x + SQUARE_SIZE//3, y + SQUARE_SIZE//3, 
-                                                 SQUARE_SIZE//3, SQUARE_SIZE//2))
-            # Crown
-            points = [(x + SQUARE_SIZE//4, y + SQUARE_SIZE//3),
-                     (x + SQUARE_SIZE*3//4, y + SQUARE_SIZE//3),
-                     (x + SQUARE_SIZE*3//4, y + SQUARE_SIZE//6),
-                     (x + SQUARE_SIZE//2, y + SQUARE_SIZE//4),
-                     (x + SQUARE_SIZE//4, y + SQUARE_SIZE//6)]
-            pygame.draw.polygon(screen, piece_color, points)
-            # Cross
-            pygame.draw.rect(screen, accent_color, (x + SQUARE_SIZE*7//16, y + SQUARE_SIZE//8, 
-                                                  SQUARE_SIZE//8, SQUARE_SIZE//4))
-            pygame.draw.rect(screen, accent_color, (x + SQUARE_SIZE//3, y + SQUARE_SIZE//6, 
-                                                  SQUARE_SIZE//3, SQUARE_SIZE//8))
+def draw_piece(screen, color, piece_type, x, y, size=SQUARE_SIZE):
+    """Draw a piece from polygons and circles; the game blits cached sprites of these instead"""
+    piece_color = WHITE if color == engine.WHITE else BLACK
+    accent_color = GOLD if color == engine.WHITE else SILVER
+    
+    if piece_type == engine.PAWN:
+        # Simple pawn - circle with a smaller circle on top
+        pygame.draw.circle(screen, piece_color, (x + size//2, y + size*3//5), size//4)
+        pygame.draw.circle(screen, piece_color, (x + size//2, y + size//3), size//6)
+    
+    elif piece_type == engine.ROOK:
+        # Castle-like rook
+        pygame.draw.rect(screen, piece_color, (x + size//4, y + size//4, 
+                                             size//2, size//2))
+        # Battlements
+        for i in range(3):
+            pygame.draw.rect(screen, piece_color, (x + size//4 + i*(size//6), 
+                                                 y + size//6, size//8, size//4))
+    
+    elif piece_type == engine.KNIGHT:
+        # Horse head shape
+        points = [(x + size//4, y + size*3//4), 
+                 (x + size*3//4, y + size*3//4),
+                 (x + size*3//4, y + size//3),
+                 (x + size//2, y + size//4),
+                 (x + size//3, y + size//2)]
+        pygame.draw.polygon(screen, piece_color, points)
+        # Eye
+        pygame.draw.circle(screen, accent_color, (x + size*2//3, y + size//2), 3)
+    
+    elif piece_type == engine.BISHOP:
+        # Bishop hat shape
+        points = [(x + size//2, y + size//4), 
+                 (x + size*3//4, y + size*3//4),
+                 (x + size//4, y + size*3//4)]
+        pygame.draw.polygon(screen, piece_color, points)
+        # Cross
+        pygame.draw.rect(screen, accent_color, (x + size*7//16, y + size//4, 
+                                              size//8, size//4))
+    
+    elif piece_type == engine.QUEEN:
+        # Crown shape
+        points = [(x + size//4, y + size*3//4),
+                 (x + size*3//4, y + size*3//4),
+                 (x + size*2//3, y + size//3),
+                 (x + size//2, y + size//2),
+                 (x + size//3, y + size//3)]
+        pygame.draw.polygon(screen, piece_color, points)
+        # Crown points
+        for i in range(3):
+            pygame.draw.circle(screen, accent_color, 
+                             (x + size//3 + i*(size//6), y + size//3), 4)
+    
+    elif piece_type == engine.KING:
+        # Base
+        pygame.draw.rect(screen, piece_color, (x + size//3, y + size//3, 
+                                             size//3, size//2))
+        # Crown
+        points = [(x + size//4, y + size//3),
+                 (x + size*3//4, y + size//3),
+                 (x + size*3//4, y + size//6),
+                 (x + size//2, y + size//4),
+                 (x + size//4, y + size//6)]
+        pygame.draw.polygon(screen, piece_color, points)
+        # Cross
+        pygame.draw.rect(screen, accent_color, (x + size*7//16, y + size//8, 
+                                              size//8, size//4))
+        pygame.draw.rect(screen, accent_color, (x + size//3, y + size//6, 
+                                              size//3, size//8))
+
+def piece_sprite(color, piece_type, size):
+    """The piece drawn once onto a transparent surface, cached per color, type and size"""
+    key = (color, piece_type, size)
+    sprite = _piece_sprites.get(key)
+    if sprite is None:
+        sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+        draw_piece(sprite, color, piece_type, 0, 0, size)
+        _piece_sprites[key] = sprite
+    return sprite
+
+
+def square_sprite(light, highlight, size):
+    """An empty square, with its selection or move highlight already blended in"""
+    key = (light, highlight, size)
+    sprite = _square_sprites.get(key)
+    if sprite is None:
+        sprite = pygame.Surface((size, size))
+        sprite.fill(LIGHT_SQUARE if light else DARK_SQUARE)
+        if highlight is not None:
+            overlay = pygame.Surface((size, size))
+            overlay.set_alpha(128)
+            overlay.fill(HIGHLIGHT_COLOR if highlight == 'selected' else TRANSPARENT_GREEN)
+            sprite.blit(overlay, (0, 0))
+        _square_sprites[key] = sprite
+    return sprite
+
+
+def squares_under(rect):
+    """(row, col) of every board square a screen rectangle touches"""
+    rows = range(max(0, rect.top // SQUARE_SIZE), min(BOARD_SIZE, (rect.bottom - 1) // SQUARE_SIZE + 1))
+    cols = range(max(0, rect.left // SQUARE_SIZE), min(BOARD_SIZE, (rect.right - 1) // SQUARE_SIZE + 1))
+    return [(row, col) for row in rows for col in cols]
+
+
+_piece_sprites = {}
+_square_sprites = {}
 
 class ChessBoard:
-    def __init__(self):
+    def __init__(self, workers=1, stats_log=None, book=None, cache=None, ponder=False, game=None, pgn=None,
+                 bitbases=None):
+        pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption('Funny Chess Game - Press A for AI, Z to Undo, +/- for AI Difficulty')
         
-        # Game state
-        self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+        # Game state lives in the headless engine; this class only draws it.
+        # The AI searches snapshots of it in a separate process.
+        # A saved game (see history.py) is resumed and written back on quit
+        self.game_path = game
+        self.pgn_path = pgn
+        self.history = GameHistory.load(game) if game and os.path.exists(game) else GameHistory()
+        self.position = self.history.position
+        self.game_over = game_over(self.history)  # (result, reason) once the game has ended
+        self.searcher = SearchProcess(workers=workers, book=book, cache=cache, bitbases=bitbases)
+        self.search_stats = engine.SearchStats()  # Latest counters sent by the search process
         self.selected_piece = None
         self.selected_pos = None
         self.valid_moves = []
-        self.white_turn = True
-        self.move_history = []
         self.promotion_pawn = None
-        self.game_over = False
         self.ai_playing = False
         self.ai_thinking = False
         self.ai_depth = AI_DEPTH
         
-        # AI thread
-        self.ai_thread = None
-        
-        # Piece values for AI
-        self.piece_values = {
-            'pawn': 1,
-            'knight': 3,
-            'bishop': 3,
-            'rook': 5,
-            'queen': 9,
-            'king': 100
-        }
-        
-        # Position bonuses for AI (center control)
-        self.position_bonus = [
-            [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
-            [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-            [0.0, 0.2, 0.4, 0.4, 0.4, 0.4, 0.2, 0.0],
-            [0.0, 0.2, 0.4, 0.6, 0.6, 0.4, 0.2, 0.0],
-            [0.0, 0.2, 0.4, 0.6, 0.6, 0.4, 0.2, 0.0],
-            [0.0, 0.2, 0.4, 0.4, 0.4, 0.4, 0.2, 0.0],
-            [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-            [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-        ]
-        
-        self.setup_board()
-
-    def evaluate_board(self):
-        """Evaluate the current board position"""
-        score = 0
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece:
-                    value = self.piece_values[piece.piece_type]
-                    # Add position bonus
-                    value += value * self.position_bonus[row][col]
-                    if piece.color == 'white':
-                        score += value
-                    else:
-                        score -= value
-        return score
-
-    def minimax(self, depth, alpha, beta, is_maximizing):
-        """Minimax algorithm for AI decision making"""
-        if depth == 0 or self.game_over:
-            return self.evaluate_board(), None
-        
-        if is_maximizing:
-            best_score = float('-inf')
-            best_move = None
-            
-            for row in range(8):
-                for col in range(8):
-                    piece = self.board[row][col]
-                    if piece and piece.color == 'black':
-                        for move in self.get_valid_moves(piece, (row, col)):
-                            new_row, new_col = move
-                            captured_piece = self.board[new_row][new_col]
-                            self.board[new_row][new_col] = piece
-                            self.board[row][col] = None
-                            piece.position = move
-                            piece.has_moved = True
-                            
-                            score, _ = self.minimax(depth - 1, alpha, beta, False)
-                            
-                            self.board[row][col] = piece
-                            self.board[new_row][new_col] = captured_piece
-                            piece.position = (row, col)
-                            piece.has_moved = False
-                            
-                            if score > best_score:
-                                best_score = score
-                                best_move = (piece, (row, col), move)
-                            
-                            alpha = max(alpha, score)
-                            if beta <= alpha:
-                                break
-            return best_score, best_move
-        
-        else:
-            best_score = float('inf')
-            best_move = None
-            
-            for row in range(8):
-                for col in range(8):
-                    piece = self.board[row][col]
-                    if piece and piece.color == 'white':
-                        for move in self.get_valid_moves(piece, (row, col)):
-                            new_row, new_col = move
-                            captured_piece = self.board[new_row][new_col]
-                            self.board[new_row][new_col] = piece
-                            self.board[row][col] = None
-                            piece.position = move
-                            piece.has_moved = True
-                            
-                            score, _ = self.minimax(depth - 1, alpha, beta, True)
-                            
-                            self.board[row][col] = piece
-                            self.board[new_row][new_col] = captured_piece
-                            piece.position = (row, col)
-                            piece.has_moved = False
-                            
-                            if score < best_score:
-                                best_score = score
-                                best_move = (piece, (row, col), move)
-                            
-                            beta = min(beta, score)
-                            if beta <= alpha:
-                                break
-            return best_score, best_move
-
-    def is_king_in_check(self, color, board=None):
-        """Check if the king of given color is in check"""
-        if board is None:
-            board = self.board
-            
-        # Find king position
-        king_pos = None
-        for row in range(8):
-            for col in range(8):
-                piece = board[row][col]
-                if piece and piece.piece_type == 'king' and piece.color == color:
-                    king_pos = (row, col)
-                    break
-        if not king_pos:
-            return False
-            
-        # Check if any opponent piece can capture the king
-        for row in range(8):
-            for col in range(8):
-                piece = board[row][col]
-                if piece and piece.color != color:
-                    moves = self.get_raw_moves(piece, (row, col), board)
-                    if king_pos in moves:
-                        return True
-        return False
-
-    def get_raw_moves(self, piece, pos, board=None):
-        """Get moves without considering check"""
-        if board is None:
-            board = self.board
-        row, col = pos
-        moves = []
-        
-        if piece.piece_type == 'pawn':
-            direction = -1 if piece.color == 'white' else 1
-            # Forward move
-            if 0 <= row + direction < 8:
-                if not board[row + direction][col]:
-                    moves.append((row + direction, col))
-                    # Double move from starting position
-                    if ((piece.color == 'white' and row == 6) or 
-                        (piece.color == 'black' and row == 1)):
-                        if not board[row + 2*direction][col]:
-                            moves.append((row + 2*direction, col))
-            
-            # Captures
-            for c in [-1, 1]:
-                if 0 <= col + c < 8 and 0 <= row + direction < 8:
-                    target = board[row + direction][col + c]
-                    if target and target.color != piece.color:
-                        moves.append((row + direction, col + c))
-        
-        elif piece.piece_type == 'knight':
-            for dr, dc in [(2,1), (2,-1), (-2,1), (-2,-1), (1,2), (1,-2), (-1,2), (-1,-2)]:
-                new_row, new_col = row + dr, col + dc
-                if 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target = board[new_row][new_col]
-                    if not target or target.color != piece.color:
-                        moves.append((new_row, new_col))
-        
-        elif piece.piece_type in ['bishop', 'rook', 'queen']:
-            directions = []
-            if piece.piece_type in ['bishop', 'queen']:
-                directions += [(1,1), (1,-1), (-1,1), (-1,-1)]
-            if piece.piece_type in ['rook', 'queen']:
-                directions += [(0,1), (0,-1), (1,0), (-1,0)]
-            
-            for dr, dc in directions:
-                new_row, new_col = row + dr, col + dc
-                while 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target = board[new_row][new_col]
-                    if not target:
-                        moves.append((new_row, new_col))
-                    else:
-                        if target.color != piece.color:
-                            moves.append((new_row, new_col))
-                        break
-                    new_row += dr
-                    new_col += dc
-        
-        elif piece.piece_type == 'king':
-            for dr in [-1, 0, 1]:
-                for dc in [-1, 0, 1]:
-                    if dr == 0 and dc == 0:
-                        continue
-                    new_row, new_col = row + dr, col + dc
-                    if 0 <= new_row < 8 and 0 <= new_col < 8:
-                        target = board[new_row][new_col]
-                        if not target or target.color != piece.color:
-                            moves.append((new_row, new_col))
-        
+        # Search whose result will be the AI's move, and the position it started from
+        self.ai_search = None
+        self.ai_fen = None
+
+        # Pondering: after its move the AI keeps thinking about the reply it expects
+        self.ponder = ponder
+        self.ponder_move = None
+        self.ponder_search = None
+        self.ponder_result = None  # The ponder search's reply, if it finished before the human moved
+
+        # Rendering caches: fonts, text surfaces, and what each square last showed
+        self.fonts = {size: pygame.font.Font(None, size) for size in (24, 36)}
+        self.text_cache = {}
+        self.drawn_squares = {}
+        self.drawn_overlays = []
+        self.stats_panel = None
+
+        # Search statistics: optional overlay (S key) and one JSON line per AI move
+        self.show_stats = False
+        self.stats_log = open(stats_log, 'a') if stats_log else None
+
+    @property
+    def white_turn(self):
+        return self.position.side == engine.WHITE
+
+    def get_valid_moves(self, pos):
+        """Map each destination square of the piece on pos to its legal move"""
+        moves = {}
+        for move in self.position.legal_moves_from(*pos):
+            target = engine.square_row_col(engine.move_to(move))
+            # Clicking a promotion square always promotes to a queen
+            if target not in moves or engine.promotion_piece(move) == engine.QUEEN:
+                moves[target] = move
         return moves
 
-    def get_valid_moves(self, piece, pos):
-        """Get valid moves considering check and pins"""
-        moves = self.get_raw_moves(piece, pos)
-        valid_moves = []
-        row, col = pos
-        
-        # Test each move
-        for move in moves:
-            # Make temporary move
-            new_row, new_col = move
-            temp_board = [row[:] for row in self.board]
-            temp_board[new_row][new_col] = piece
-            temp_board[row][col] = None
-            
-            # If move doesn't leave king in check, it's valid
-            if not self.is_king_in_check(piece.color, temp_board):
-                valid_moves.append(move)
-        
-        return valid_moves
+    def apply_move(self, move, is_ai_move=False):
+        """Play a move on the position and check whether the game is over"""
+        self.history.push(move, by_ai=is_ai_move)
+
+        # Checkmate, stalemate and the draw rules end the game
+        self.game_over = game_over(self.history)
+        if self.game_over:
+            print(self.game_over_text() + '!')
+        elif self.position.in_check():
+            print(f"Check! {'White' if self.white_turn else 'Black'} is in check.")
+
+    def game_over_text(self):
+        result, reason = self.game_over
+        if result == '1/2-1/2':
+            return f"Draw by {reason}"
+        return f"{reason.capitalize()}! {'White' if result == '1-0' else 'Black'} wins"
 
     def make_ai_move(self):
-        """Start AI move in a separate thread"""
-        def ai_move_thread():
-            self.ai_thinking = True
-            _, best_move = self.minimax(self.ai_depth, float('-inf'), float('inf'), True)  # True for maximizing (black)
+        """Ask the search process for a move; poll_search plays it when it arrives"""
+        if self.ai_thinking:
+            return  # Already searching the same position
+        self.ai_thinking = True
+        self.ai_fen = self.position.fen()
+        if not self.take_ponder_search():
+            self.ai_search = self.searcher.start(self.position, self.ai_depth,
+                                                 movetime=AI_MOVETIME_MS[self.ai_depth])
+
+    def poll_search(self):
+        """Pick up progress and results from the search process"""
+        for reply in self.searcher.poll():
+            kind, search_id, stats = reply[0], reply[1], reply[-1]
+            if search_id not in (self.ai_search, self.ponder_search):
+                continue  # Cancelled or superseded
+            self.search_stats = stats
+            if kind != 'done':
+                continue
+            if search_id == self.ai_search:
+                self.finish_ai_move(*reply[2:])
+            else:
+                self.ponder_result = reply[2:]
+
+    def finish_ai_move(self, score, move, pv, stats):
+        """Play the move the search came back with, then start pondering"""
+        self.ai_search = None
+        self.ai_thinking = False
+        self.search_stats = stats
+        self.log_search(self.ai_fen, score, move, stats)
+        if move is None or self.game_over:
+            return
+        self.apply_move(move, is_ai_move=True)
+        self.ponder_move = pv[1] if len(pv) > 1 and pv[0] == move else None
+        if self.ponder and not self.game_over:
+            self.start_ponder()
+
+    def log_search(self, fen, score, move, stats):
+        """Append one JSON line describing the search that just finished"""
+        if self.stats_log is None:
+            return
+        record = {
+            'time': round(time.time(), 3),
+            'ply': len(self.history),
+            'fen': fen,
+            'move': engine.move_to_uci(move) if move is not None else None,
+            'score': score,
+            'level': self.ai_depth,
+        }
+        record.update(stats.as_dict())
+        self.stats_log.write(json.dumps(record) + '\n')
+        self.stats_log.flush()
+
+    def cancel_ai_move(self):
+        """Stop a running AI search and throw its result away"""
+        if self.ai_search is not None:
+            self.searcher.stop()
+            self.ai_search = None
             self.ai_thinking = False
-            
-            if best_move and not self.game_over:
-                piece, old_pos, new_pos = best_move
-                old_row, old_col = old_pos
-                new_row, new_col = new_pos
-                
-                # Make the move
-                captured_piece = self.board[new_row][new_col]
-                self.board[new_row][new_col] = piece
-                self.board[old_row][old_col] = None
-                piece.position = new_pos
-                piece.has_moved = True
-                
-                # Record move
-                self.move_history.append({
-                    'piece': piece,
-                    'from': old_pos,
-                    'to': new_pos,
-                    'captured': captured_piece,
-                    'is_ai_move': True  # Mark this as an AI move
-                })
-                
-                # Switch turns
-                self.white_turn = True
-                
-                # Check for checkmate
-                if self.is_king_in_check('white'):
-                    if self.is_checkmate('white'):
-                        self.game_over = True
-                        print("Checkmate! Black wins!")
-                    else:
-                        print("Check!")
-        
-        self.ai_thread = threading.Thread(target=ai_move_thread)
-        self.ai_thread.start()
+        self.end_ponder()
 
-    def setup_board(self):
-        # Piece setup
-        piece_order = ['rook', 'knight', 'bishop', 'queen', 'king', 'bishop', 'knight', 'rook']
-        
-        # White pieces
-        for i in range(BOARD_SIZE):
-            self.board[6][i] = ChessPiece('white', 'pawn', (6, i))
-            if i < 8:
-                self.board[7][i] = ChessPiece('white', piece_order[i], (7, i))
-        
-        # Black pieces
-        for i in range(BOARD_SIZE):
-            self.board[1][i] = ChessPiece('black', 'pawn', (1, i))
-            if i < 8:
-                self.board[0][i] = ChessPiece('black', piece_order[i], (0, i))
+    def start_ponder(self):
+        """Search the position after the human's expected reply until they move"""
+        if self.ponder_move is None:
+            return
+        ponder_position = self.position.copy()
+        ponder_position.make_move(self.ponder_move)
+        self.ponder_result = None
+        self.ponder_search = self.searcher.start(ponder_position, self.ai_depth,
+                                                 movetime=AI_MOVETIME_MS[self.ai_depth], ponder=True)
 
-    def draw_board(self):
-        # Draw checkered board
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
-                pygame.draw.rect(self.screen, color, 
-                               (col * SQUARE_SIZE, row * SQUARE_SIZE, 
-                                SQUARE_SIZE, SQUARE_SIZE))
-                
-                # Highlight selected piece and valid moves
-                if (row, col) == self.selected_pos:
-                    s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
-                    s.set_alpha(128)
-                    s.fill(HIGHLIGHT_COLOR)
-                    self.screen.blit(s, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-                elif (row, col) in self.valid_moves:
-                    s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
-                    s.set_alpha(128)
-                    s.fill(TRANSPARENT_GREEN)
-                    self.screen.blit(s, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-        
-        # Draw pieces
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = self.board[row][col]
-                if piece:
-                    piece.draw(self.screen, col * SQUARE_SIZE, row * SQUARE_SIZE)
-        
-        # Draw game status
-        font = pygame.font.Font(None, 36)
-        
+    def take_ponder_search(self):
+        """If the human just played the expected move, make the ponder search the AI's search
+
+        Its clock starts now (or its result is played at once if it already
+        finished). Any other move ends pondering; whatever the ponder search
+        stored in the transposition table stays there.
+        """
+        search, self.ponder_search = self.ponder_search, None
+        if search is None:
+            return False
+        last = self.history.last()
+        if last is None or last[1] or last[0] != self.ponder_move:
+            self.searcher.stop()
+            return False
+        self.ai_search = search
+        if self.ponder_result is not None:
+            self.finish_ai_move(*self.ponder_result)
+        else:
+            self.searcher.ponderhit()
+        return True
+
+    def end_ponder(self):
+        """Stop pondering without using the result"""
+        if self.ponder_search is not None:
+            self.searcher.stop()
+            self.ponder_search = None
+            self.ponder_result = None
+
+    def text(self, text, size, color):
+        """Rendered text, cached so unchanged labels aren't re-rendered every frame"""
+        key = (text, size, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            if len(self.text_cache) >= TEXT_CACHE_SIZE:
+                self.text_cache.clear()
+            surface = self.text_cache[key] = self.fonts[size].render(text, True, color)
+        return surface
+
+    def overlays(self):
+        """Everything drawn on top of the squares, as (surface, position) in drawing order"""
+        items = []
         # Draw turn indicator
         turn_text = "White's Turn" if self.white_turn else "Black's Turn"
         if self.game_over:
-            turn_text = f"Game Over! {'Black' if not self.white_turn else 'White'} wins!"
-        text = font.render(turn_text, True, RED)
-        self.screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 10))
-        
+            turn_text = f"Game Over! {self.game_over_text()}!"
+        text = self.text(turn_text, 36, RED)
+        items.append((text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 10)))
+
         # Draw AI status and difficulty
         if self.ai_playing:
-            status = f"AI: ON (Depth: {self.ai_depth})" + (" (thinking...)" if self.ai_thinking else "")
+            status = f"AI: ON (Depth: {self.ai_depth})"
+            if self.ai_thinking:
+                status += " (thinking...)"
+            elif self.ponder_search is not None:
+                status += " (pondering...)"
         else:
             status = "AI: OFF (Press A to toggle)"
-        text = font.render(status, True, RED)
-        self.screen.blit(text, (10, 10))
-        
+        items.append((self.text(status, 36, RED), (10, 10)))
+
         # Draw difficulty controls
         if self.ai_playing:
-            diff_text = "Use +/- to adjust AI difficulty"
-            text = font.render(diff_text, True, BLUE)
-            self.screen.blit(text, (10, SCREEN_HEIGHT - 30))
-        
+            items.append((self.text("Use +/- to adjust AI difficulty", 36, BLUE), (10, SCREEN_HEIGHT - 30)))
+
         # Draw undo hint
-        undo_text = font.render("Press Z to undo", True, RED)
-        self.screen.blit(undo_text, (SCREEN_WIDTH - 200, 10))
+        items.append((self.text("Press Z to undo", 36, RED), (SCREEN_WIDTH - 200, 10)))
+
+        if self.show_stats:
+            items.extend(self.stats_overlays())
+        return items
+
+    def stats_overlays(self):
+        """The current (or last) search's counters, updated live while thinking"""
+        stats = self.search_stats
+        lines = [
+            f"Depth {stats.depth} (sel {stats.seldepth})",
+            f"Nodes {stats.nodes} ({stats.qnodes} quiescence)",
+            f"NPS {stats.nps}  Time {stats.running_time():.2f}s",
+            f"Evals {stats.evaluations}",
+            f"Cutoffs {stats.beta_cutoffs} ({stats.first_move_cutoff_rate:.0%} on 1st move)",
+            f"TT hits {stats.tt_hits}/{stats.tt_probes} ({stats.tt_hit_rate:.0%})",
+            f"Bitbase hits {stats.bitbase_hits}",
+        ]
+        if self.stats_panel is None:
+            self.stats_panel = pygame.Surface((330, 20 * len(lines) + 10))
+            self.stats_panel.set_alpha(200)
+            self.stats_panel.fill(BLACK)
+        items = [(self.stats_panel, (10, 50))]
+        for i, line in enumerate(lines):
+            items.append((self.text(line, 24, WHITE), (18, 56 + 20 * i)))
+        return items
+
+    def redraw_all(self):
+        """Forget what is on screen so the next draw_board repaints every square"""
+        self.drawn_squares = {}
+        self.drawn_overlays = []
+
+    def draw_board(self):
+        """Repaint only the squares that changed or sit under a changed overlay; returns their rects"""
+        dirty = set()
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                if (row, col) == self.selected_pos:
+                    highlight = 'selected'
+                elif (row, col) in self.valid_moves:
+                    highlight = 'move'
+                else:
+                    highlight = None
+                state = (self.position.piece_at(row, col), highlight)
+                if self.drawn_squares.get((row, col)) != state:
+                    self.drawn_squares[(row, col)] = state
+                    dirty.add((row, col))
+
+        overlays = [(surface, pygame.Rect(pos, surface.get_size())) for surface, pos in self.overlays()]
+        if overlays != self.drawn_overlays:
+            # Text changed: repaint what it covered before and what it covers now
+            for _, rect in overlays + self.drawn_overlays:
+                dirty.update(squares_under(rect))
+            self.drawn_overlays = overlays
+
+        rects = []
+        for row, col in dirty:
+            rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+            # Clip to the square so overlays crossing into clean squares aren't blended twice
+            self.screen.set_clip(rect)
+            piece, highlight = self.drawn_squares[(row, col)]
+            self.screen.blit(square_sprite((row + col) % 2 == 0, highlight, SQUARE_SIZE), rect)
+            if piece:
+                self.screen.blit(piece_sprite(piece[0], piece[1], SQUARE_SIZE), rect)
+            for surface, overlay_rect in overlays:
+                if overlay_rect.colliderect(rect):
+                    self.screen.blit(surface, overlay_rect)
+            rects.append(rect)
+        self.screen.set_clip(None)
+        return rects
 
     def get_square_under_mouse(self):
         x, y = pygame.mouse.get_pos()
@@ -477,42 +445,15 @@ class ChessBoard:
         
         if not self.selected_piece:
             # Select piece
-            piece = self.board[row][col]
-            if piece and ((piece.color == 'white' and self.white_turn) or 
-                         (piece.color == 'black' and not self.white_turn)):
+            piece = self.position.piece_at(row, col)
+            if piece and piece[0] == self.position.side:
                 self.selected_piece = piece
                 self.selected_pos = pos
-                self.valid_moves = self.get_valid_moves(piece, pos)
+                self.valid_moves = self.get_valid_moves(pos)
         else:
             # Move piece if valid
             if pos in self.valid_moves:
-                old_row, old_col = self.selected_pos
-                captured_piece = self.board[row][col]
-                
-                # Record move for undo
-                self.move_history.append({
-                    'piece': self.selected_piece,
-                    'from': self.selected_pos,
-                    'to': pos,
-                    'captured': captured_piece
-                })
-                
-                # Make move
-                self.board[row][col] = self.selected_piece
-                self.board[old_row][old_col] = None
-                self.selected_piece.position = pos
-                self.selected_piece.has_moved = True
-                
-                # Switch turns
-                self.white_turn = not self.white_turn
-                
-                # Check for checkmate
-                if self.is_king_in_check('white' if not self.white_turn else 'black'):
-                    if self.is_checkmate('white' if not self.white_turn else 'black'):
-                        self.game_over = True
-                        print(f"Checkmate! {'Black' if not self.white_turn else 'White'} wins!")
-                    else:
-                        print(f"Check! {'White' if not self.white_turn else 'Black'} is in check.")
+                self.apply_move(self.valid_moves[pos])
                 
                 # AI move
                 if self.ai_playing and not self.white_turn and not self.game_over:
@@ -524,46 +465,44 @@ class ChessBoard:
             self.valid_moves = []
 
     def undo_move(self):
-        if self.move_history:
-            move = self.move_history.pop()
-            piece = move['piece']
-            old_pos = move['from']
-            new_pos = move['to']
-            captured_piece = move['captured']
-            
-            self.board[old_pos[0]][old_pos[1]] = piece
-            self.board[new_pos[0]][new_pos[1]] = captured_piece
-            piece.position = old_pos
-            
-            # Switch turns
-            self.white_turn = not self.white_turn
+        if self.history.pop() is not None:
+            self.game_over = None
 
-    def is_checkmate(self, color):
-        """Check if the given color is in checkmate"""
-        # First check if king is in check
-        if not self.is_king_in_check(color):
-            return False
-            
-        # For each piece of the given color
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece and piece.color == color:
-                    # Get all valid moves for this piece
-                    moves = self.get_valid_moves(piece, (row, col))
-                    # If there are any legal moves, it's not checkmate
-                    if moves:
-                        return False
-        
-        # If we get here, it's checkmate
-        return True
+    def redo_move(self):
+        """Replay the next taken-back move, if there is one"""
+        if self.history.redo() is not None:
+            self.game_over = game_over(self.history)
+
+    def save_game(self):
+        """Write the game to --game (compact, for resuming) and append it to --pgn"""
+        if self.game_path:
+            self.history.save(self.game_path)
+        if self.pgn_path:
+            result = self.game_over[0] if self.game_over else '*'
+            headers = {'Event': 'Funny Chess Game', 'Site': '?', 'Date': time.strftime('%Y.%m.%d'),
+                       'Round': '-', 'White': 'Human', 'Black': 'AI' if self.ai_playing else 'Human'}
+            with open(self.pgn_path, 'a') as f:
+                self.history.write_pgn(f, headers, result)
 
     def run(self):
         clock = pygame.time.Clock()
         
         while True:
-            for event in pygame.event.get():
+            self.poll_search()
+            events = pygame.event.get()
+            if not events and not self.ai_thinking and not (self.show_stats and self.ponder_search is not None):
+                # Nothing to animate or wait for: sleep until an event arrives
+                events = [pygame.event.wait(IDLE_WAIT_MS)]
+            for event in events:
+                if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                    self.redraw_all()
+
                 if event.type == pygame.QUIT:
+                    self.cancel_ai_move()
+                    self.searcher.close()
+                    self.save_game()
+                    if self.stats_log is not None:
+                        self.stats_log.close()
                     pygame.quit()
                     sys.exit()
                 
@@ -573,13 +512,28 @@ class ChessBoard:
                         self.handle_click(pos)
                 
                 if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_z and not self.ai_thinking:  # Undo
+                    if event.key in (pygame.K_z, pygame.K_LEFT):  # Undo
+                        # Stop the AI mid-thought; it was about to answer the move being undone
+                        self.cancel_ai_move()
                         # Undo twice if AI is playing (player's move + AI's move)
                         self.undo_move()
                         if self.ai_playing and not self.white_turn:
                             self.undo_move()
+                    elif event.key in (pygame.K_y, pygame.K_RIGHT):  # Redo a taken-back move
+                        self.cancel_ai_move()
+                        self.redo_move()
+                        if self.ai_playing and not self.white_turn:
+                            self.redo_move()
+                    elif event.key == pygame.K_s:  # Toggle search stats overlay
+                        self.show_stats = not self.show_stats
+                    elif event.key == pygame.K_p:  # Toggle pondering
+                        self.ponder = not self.ponder
+                        if not self.ponder:
+                            self.end_ponder()
                     elif event.key == pygame.K_a:  # Toggle AI
                         self.ai_playing = not self.ai_playing
+                        if not self.ai_playing:
+                            self.end_ponder()
                         if self.ai_playing and not self.white_turn and not self.ai_thinking:
                             self.make_ai_move()
                     elif event.key in [pygame.K_PLUS, pygame.K_KP_PLUS, pygame.K_EQUALS]:  # Increase difficulty
@@ -593,16 +547,40 @@ class ChessBoard:
             if self.ai_playing and not self.white_turn and not self.ai_thinking and not self.game_over:
                 self.make_ai_move()
             
-            # Draw everything
-            self.screen.fill(WHITE)
-            self.draw_board()
-            pygame.display.flip()
+            # Draw what changed
+            rects = self.draw_board()
+            if rects:
+                pygame.display.update(rects)
             
             # Control game speed
             clock.tick(60)
 
 def main():
-    game = ChessBoard()
+    parser = argparse.ArgumentParser(description='Funny Chess Game')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='worker processes for the AI search (1 = single-process, deterministic)')
+    parser.add_argument('--stats-log', metavar='PATH',
+                        help='append one JSON line of search statistics per AI move to PATH')
+    parser.add_argument('--book', metavar='PATH', help='Polyglot .bin opening book to play from before searching')
+    parser.add_argument('--cache', metavar='PATH',
+                        help='SQLite file of past analysis, shared by every game and process using it')
+    parser.add_argument('--bitbases', metavar='DIR',
+                        help='endgame bitbases built by bitbase.py, for exact play with 4 pieces or fewer')
+    parser.add_argument('--ponder', action='store_true',
+                        help="let the AI think on your time about the reply it expects (P toggles it in game)")
+    parser.add_argument('--uci', action='store_true',
+                        help='speak UCI on stdin/stdout instead of opening a window (for GUIs and match runners)')
+    parser.add_argument('--game', metavar='PATH', help='resume the game saved in PATH, and save it there on quit')
+    parser.add_argument('--pgn', metavar='PATH', help='append the game to this PGN file on quit')
+    args = parser.parse_args()
+
+    if args.uci:
+        import uci
+        uci.main()
+        return
+
+    game = ChessBoard(workers=args.threads, stats_log=args.stats_log, book=args.book, cache=args.cache,
+                      ponder=args.ponder, game=args.game, pgn=args.pgn, bitbases=args.bitbases)
     game.run()
 
 if __name__ == '__main__':
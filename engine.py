@@ -0,0 +1,1599 @@
+"""Headless chess engine: rules, evaluation and search without any pygame import.
+
+The GUI in chess_game.py is a thin front-end over this module, and batch
+analysis workers can import it without paying for SDL or a window.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from polyglot_randoms import POLYGLOT_RANDOMS
+
+# Colors and piece types
+WHITE = 0
+BLACK = 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+COLOR_NAMES = ('white', 'black')
+PIECE_NAMES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+PIECE_LETTERS = 'pnbrqk'
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+LEGAL_MOVE_CACHE_SIZE = 64  # Positions a Position remembers the legal moves of (see cached_legal_moves)
+
+# Move encoding: from square (6 bits), to square (6 bits), flags (4 bits).
+# Squares are numbered row * 8 + col with row 0 being Black's back rank,
+# the same orientation the GUI draws.
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EP_CAPTURE = 5
+PROMOTION = 8  # Low two bits pick the piece: knight, bishop, rook, queen
+
+# Castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+# Piece values in centipawns (used for capture ordering and exchanges)
+PIECE_VALUES = (100, 300, 300, 500, 900, 10000)
+
+# Evaluation: material plus piece-square tables for the middlegame and the
+# endgame, blended by how much non-pawn material is left. Tables are from
+# White's point of view with a8 first, the same order as our squares.
+MG_VALUES = (100, 320, 330, 500, 900, 0)
+EG_VALUES = (120, 300, 320, 520, 950, 0)
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+TOTAL_PHASE = 24  # Phase of the starting position; 0 is a bare-kings ending
+
+PAWN_MG = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+PAWN_EG = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    80, 80, 80, 80, 80, 80, 80, 80,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    15, 15, 15, 15, 15, 15, 15, 15,
+    5, 5, 5, 5, 5, 5, 5, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+KNIGHT_PST = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_PST = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_PST = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0,
+)
+QUEEN_PST = (
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+)
+KING_MG = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20,
+)
+KING_EG = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+)
+MG_TABLES = (PAWN_MG, KNIGHT_PST, BISHOP_PST, ROOK_PST, QUEEN_PST, KING_MG)
+EG_TABLES = (PAWN_EG, KNIGHT_PST, BISHOP_PST, ROOK_PST, QUEEN_PST, KING_EG)
+
+INFINITY = 1000000
+MATE_SCORE = 100000
+MATE_BOUND = MATE_SCORE - 1000  # Scores beyond this are mate-in-N
+BITBASE_WIN = 20000  # An endgame the bitbases say is won, plus how close to mate it looks; below any mate
+
+# Transposition table bound types and default size
+EXACT, LOWER_BOUND, UPPER_BOUND = range(3)
+DEFAULT_HASH_MB = 16
+
+MAX_SEARCH_DEPTH = 64
+MAX_PLY = 128
+STOP_CHECK_NODES = 1024  # How often (in nodes) the search looks at the clock and stop flag
+PROGRESS_POLL_SECONDS = 0.05  # How often a parallel search collects the depths its workers have finished
+MOVE_OVERHEAD_MS = 50  # Kept back from every clock-based budget for I/O lag
+DEFAULT_MOVES_TO_GO = 30  # Assume sudden death lasts this many more moves
+
+# Move ordering: hash move, then captures and promotions by most valuable
+# victim / least valuable attacker, then killer moves, then quiet moves by
+# their history score (which is kept below KILLER_SCORE)
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 26
+KILLER_SCORE = 1 << 24
+HISTORY_LIMIT = KILLER_SCORE - 1
+DELTA_MARGIN = 200  # Quiescence skips captures that can't lift the score near alpha
+
+# Selective search, each part switchable on Engine for benchmarking
+SEARCH_FEATURES = ('null_move', 'late_move_reductions', 'aspiration_windows')
+NULL_MOVE_REDUCTION = 2  # Passing is searched this much shallower than a real move
+NULL_MOVE_MIN_DEPTH = 3
+LMR_MIN_DEPTH = 3
+LMR_FULL_DEPTH_MOVES = 3  # The first moves of a node are never reduced
+ASPIRATION_MIN_DEPTH = 4  # Shallower iterations are too unstable to guess a window for
+ASPIRATION_WINDOW = 50  # Half-width of the first root window around the last score
+MVV_LVA = tuple(tuple(PIECE_VALUES[victim] * 8 - attacker for attacker in range(6)) for victim in range(6))
+
+
+def square(row, col):
+    return row * 8 + col
+
+
+def square_row_col(sq):
+    return sq >> 3, sq & 7
+
+
+def encode_move(from_sq, to_sq, flags=QUIET):
+    return from_sq | (to_sq << 6) | (flags << 12)
+
+
+def move_from(move):
+    return move & 63
+
+
+def move_to(move):
+    return (move >> 6) & 63
+
+
+def move_flags(move):
+    return move >> 12
+
+
+def square_name(sq):
+    row, col = square_row_col(sq)
+    return 'abcdefgh'[col] + str(8 - row)
+
+
+def parse_square(name):
+    return square(8 - int(name[1]), 'abcdefgh'.index(name[0]))
+
+
+def promotion_piece(move):
+    """Piece type a move promotes to, or None"""
+    flags = move >> 12
+    return KNIGHT + (flags & 3) if flags & PROMOTION else None
+
+
+def move_to_uci(move):
+    """Long algebraic notation, e.g. e2e4 or e7e8q"""
+    text = square_name(move_from(move)) + square_name(move_to(move))
+    promoted = promotion_piece(move)
+    return text + PIECE_LETTERS[promoted] if promoted is not None else text
+
+
+def parse_move(position, text):
+    """The legal move of position written as text in UCI notation, or None"""
+    for move in position.cached_legal_moves():
+        if move_to_uci(move) == text:
+            return move
+    return None
+
+
+KNIGHT_OFFSETS = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+ROOK_DIRECTIONS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+
+# Bitboards: bit n is square n, so bit 0 is a8 and bit 63 is h1
+FULL = (1 << 64) - 1
+ROW_MASKS = tuple(0xFF << (8 * row) for row in range(8))
+
+
+def iter_bits(bb):
+    """Yield the square of every set bit, lowest first"""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def _offset_table(offsets):
+    table = []
+    for sq in range(64):
+        row, col = square_row_col(sq)
+        bb = 0
+        for dr, dc in offsets:
+            if 0 <= row + dr < 8 and 0 <= col + dc < 8:
+                bb |= 1 << square(row + dr, col + dc)
+        table.append(bb)
+    return tuple(table)
+
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = square_row_col(sq)
+        bb = 0
+        row, col = row + dr, col + dc
+        while 0 <= row < 8 and 0 <= col < 8:
+            bb |= 1 << square(row, col)
+            row, col = row + dr, col + dc
+        table.append(bb)
+    return tuple(table)
+
+
+KNIGHT_ATTACKS = _offset_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _offset_table(KING_OFFSETS)
+# Squares a pawn of the given color attacks from each square
+PAWN_ATTACKS = (_offset_table(((-1, -1), (-1, 1))), _offset_table(((1, -1), (1, 1))))
+
+# Rays split by whether they run towards higher square numbers (first blocker is
+# the lowest bit) or lower square numbers (first blocker is the highest bit)
+BISHOP_RAYS_UP = tuple(_ray_table(dr, dc) for dr, dc in BISHOP_DIRECTIONS if dr * 8 + dc > 0)
+BISHOP_RAYS_DOWN = tuple(_ray_table(dr, dc) for dr, dc in BISHOP_DIRECTIONS if dr * 8 + dc < 0)
+ROOK_RAYS_UP = tuple(_ray_table(dr, dc) for dr, dc in ROOK_DIRECTIONS if dr * 8 + dc > 0)
+ROOK_RAYS_DOWN = tuple(_ray_table(dr, dc) for dr, dc in ROOK_DIRECTIONS if dr * 8 + dc < 0)
+
+
+def _slider_attacks(sq, occupied, rays_up, rays_down):
+    attacks = 0
+    for rays in rays_up:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in rays_down:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+def bishop_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, BISHOP_RAYS_UP, BISHOP_RAYS_DOWN)
+
+
+def rook_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, ROOK_RAYS_UP, ROOK_RAYS_DOWN)
+
+
+def _xor_keys(keys):
+    result = 0
+    for key in keys:
+        result ^= key
+    return result
+
+
+def _score_table(values, tables):
+    """Signed material + square bonus per [color][piece_type][square], White positive"""
+    return (
+        tuple(tuple(values[piece_type] + tables[piece_type][sq] for sq in range(64))
+              for piece_type in range(6)),
+        # Black reads the tables upside down (sq ^ 56 flips the row)
+        tuple(tuple(-(values[piece_type] + tables[piece_type][sq ^ 56]) for sq in range(64))
+              for piece_type in range(6)),
+    )
+
+
+MG_SCORES = _score_table(MG_VALUES, MG_TABLES)
+EG_SCORES = _score_table(EG_VALUES, EG_TABLES)
+
+
+# Every line a piece could pin along to a king on each square
+QUEEN_LINES = tuple(bishop_attacks(sq, 0) | rook_attacks(sq, 0) for sq in range(64))
+
+# Shared (color, piece_type) tuples for the mailbox view of the board
+PIECES = tuple(tuple((color, piece_type) for piece_type in range(6)) for color in (WHITE, BLACK))
+
+# Castling rights that survive a move touching each square
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[square(7, 4)] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[square(7, 7)] &= ~WHITE_KINGSIDE
+CASTLING_MASK[square(7, 0)] &= ~WHITE_QUEENSIDE
+CASTLING_MASK[square(0, 4)] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[square(0, 7)] &= ~BLACK_KINGSIDE
+CASTLING_MASK[square(0, 0)] &= ~BLACK_QUEENSIDE
+CASTLING_MASK = tuple(CASTLING_MASK)
+CASTLING_LETTERS = 'KQkq'
+
+# Zobrist keys are Polyglot's own random numbers, so a position's key is the
+# one opening books are indexed by (and is the same in every process)
+ZOBRIST_RANDOMS = POLYGLOT_RANDOMS
+ZOBRIST_PIECE = tuple(
+    tuple(
+        tuple(ZOBRIST_RANDOMS[64 * (2 * piece_type + (color == WHITE)) + 8 * (7 - (sq >> 3)) + (sq & 7)]
+              for sq in range(64))
+        for piece_type in range(6))
+    for color in (WHITE, BLACK))
+ZOBRIST_CASTLING = tuple(
+    _xor_keys(ZOBRIST_RANDOMS[768 + i] for i in range(4) if rights >> i & 1) for rights in range(16))
+ZOBRIST_EP = ZOBRIST_RANDOMS[772:780]
+ZOBRIST_WHITE_TO_MOVE = ZOBRIST_RANDOMS[780]
+
+
+class Position:
+    """A chess position with make/unmake support, independent of any GUI
+
+    Pieces are kept as one 64-bit occupancy bitboard per color and piece type,
+    plus a square-indexed mailbox so piece_at() stays O(1).
+    """
+
+    def __init__(self):
+        self.bitboards = [[0] * 6, [0] * 6]
+        self.occupied = [0, 0]
+        self.squares = [None] * 64  # (color, piece_type) or None
+        self.king_squares = [None, None]
+        self.side = WHITE
+        self.castling = 0
+        self.ep_square = None  # Square a pawn just skipped over
+        self.halfmove = 0
+        self.fullmove = 1
+        self.key = 0  # Zobrist key, updated incrementally
+        # Running evaluation terms, updated as pieces come and go
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+        # One record per made move: (move, piece_type, captured, castling, ep_square, halfmove, key)
+        self._undo = []
+        # Keys of the game positions before this one that it was set up without making the moves, oldest first
+        self._prior_keys = ()
+        self._legal_cache = OrderedDict()  # key -> tuple of legal moves, least recently used first
+
+    @classmethod
+    def start(cls):
+        return cls.from_fen(START_FEN)
+
+    @classmethod
+    def from_fen(cls, fen, history=()):
+        """Set up a position from a FEN string, after the positions whose keys are in history"""
+        fields = fen.split()
+        pos = cls()
+        row, col = 0, 0
+        for char in fields[0]:
+            if char == '/':
+                row, col = row + 1, 0
+            elif char.isdigit():
+                col += int(char)
+            else:
+                color = WHITE if char.isupper() else BLACK
+                pos.put_piece(square(row, col), color, PIECE_LETTERS.index(char.lower()))
+                col += 1
+        pos.side = WHITE if len(fields) < 2 or fields[1] == 'w' else BLACK
+        if len(fields) > 2:
+            for char in fields[2].replace('-', ''):
+                pos.castling |= 1 << CASTLING_LETTERS.index(char)
+        if len(fields) > 3 and fields[3] != '-':
+            pos.ep_square = parse_square(fields[3])
+        if len(fields) > 5:
+            pos.halfmove, pos.fullmove = int(fields[4]), int(fields[5])
+        pos.key = pos.compute_key()
+        pos._prior_keys = tuple(history)
+        return pos
+
+    def fen(self):
+        rows = []
+        for row in range(8):
+            text, empty = '', 0
+            for col in range(8):
+                piece = self.squares[square(row, col)]
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    text, empty = text + str(empty), 0
+                letter = PIECE_LETTERS[piece[1]]
+                text += letter.upper() if piece[0] == WHITE else letter
+            rows.append(text + (str(empty) if empty else ''))
+        castling = ''.join(letter for i, letter in enumerate(CASTLING_LETTERS) if self.castling >> i & 1)
+        ep = square_name(self.ep_square) if self.ep_square is not None else '-'
+        return '%s %s %s %s %d %d' % ('/'.join(rows), 'wb'[self.side], castling or '-', ep,
+                                      self.halfmove, self.fullmove)
+
+    def copy(self):
+        pos = Position()
+        pos.bitboards = [self.bitboards[WHITE][:], self.bitboards[BLACK][:]]
+        pos.occupied = self.occupied[:]
+        pos.squares = self.squares[:]
+        pos.king_squares = self.king_squares[:]
+        pos.side = self.side
+        pos.castling = self.castling
+        pos.ep_square = self.ep_square
+        pos.halfmove = self.halfmove
+        pos.fullmove = self.fullmove
+        pos.key = self.key
+        pos.mg_score = self.mg_score
+        pos.eg_score = self.eg_score
+        pos.phase = self.phase
+        pos._prior_keys = self.history_keys()
+        return pos
+
+    def history_keys(self):
+        """Keys of the earlier positions this one could still repeat, oldest first"""
+        keys = self._prior_keys + tuple(record[6] for record in self._undo)
+        return keys[max(0, len(keys) - self.halfmove):]
+
+    def _ep_key(self):
+        """En passant only counts towards the key when the side to move can capture"""
+        ep = self.ep_square
+        if ep is not None and PAWN_ATTACKS[self.side ^ 1][ep] & self.bitboards[self.side][PAWN]:
+            return ZOBRIST_EP[ep & 7]
+        return 0
+
+    def compute_key(self):
+        """Zobrist key from scratch; make/unmake keep self.key in sync incrementally"""
+        key = ZOBRIST_CASTLING[self.castling] ^ self._ep_key()
+        if self.side == WHITE:
+            key ^= ZOBRIST_WHITE_TO_MOVE
+        for sq, piece in enumerate(self.squares):
+            if piece is not None:
+                key ^= ZOBRIST_PIECE[piece[0]][piece[1]][sq]
+        return key
+
+    def put_piece(self, sq, color, piece_type):
+        bit = 1 << sq
+        self.bitboards[color][piece_type] |= bit
+        self.occupied[color] |= bit
+        self.squares[sq] = PIECES[color][piece_type]
+        self.key ^= ZOBRIST_PIECE[color][piece_type][sq]
+        self.mg_score += MG_SCORES[color][piece_type][sq]
+        self.eg_score += EG_SCORES[color][piece_type][sq]
+        self.phase += PHASE_WEIGHTS[piece_type]
+        if piece_type == KING:
+            self.king_squares[color] = sq
+
+    def remove_piece(self, sq):
+        color, piece_type = self.squares[sq]
+        bit = 1 << sq
+        self.bitboards[color][piece_type] ^= bit
+        self.occupied[color] ^= bit
+        self.squares[sq] = None
+        self.key ^= ZOBRIST_PIECE[color][piece_type][sq]
+        self.mg_score -= MG_SCORES[color][piece_type][sq]
+        self.eg_score -= EG_SCORES[color][piece_type][sq]
+        self.phase -= PHASE_WEIGHTS[piece_type]
+
+    def piece_at(self, row, col):
+        return self.squares[square(row, col)]
+
+    def king_square(self, color):
+        return self.king_squares[color]
+
+    def is_attacked(self, sq, by_color):
+        """Is sq attacked by any piece of by_color? Works outward from sq."""
+        enemy = self.bitboards[by_color]
+        if KNIGHT_ATTACKS[sq] & enemy[KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & enemy[KING]:
+            return True
+        if PAWN_ATTACKS[by_color ^ 1][sq] & enemy[PAWN]:
+            return True
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        if bishop_attacks(sq, occupied) & (enemy[BISHOP] | enemy[QUEEN]):
+            return True
+        if rook_attacks(sq, occupied) & (enemy[ROOK] | enemy[QUEEN]):
+            return True
+        return False
+
+    def _pawn_moves(self, color, pawns, moves, captures_only=False):
+        empty = ~(self.occupied[WHITE] | self.occupied[BLACK]) & FULL
+        if color == WHITE:
+            single = (pawns >> 8) & empty
+            double = ((single & ROW_MASKS[5]) >> 8) & empty
+            step, last_row = -8, ROW_MASKS[0]
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & ROW_MASKS[2]) << 8) & empty
+            step, last_row = 8, ROW_MASKS[7]
+        if not captures_only:
+            for to_sq in iter_bits(single & ~last_row):
+                moves.append(encode_move(to_sq - step, to_sq))
+            for to_sq in iter_bits(double):
+                moves.append(encode_move(to_sq - 2 * step, to_sq, DOUBLE_PUSH))
+        for to_sq in iter_bits(single & last_row):
+            self._add_promotions(to_sq - step, to_sq, PROMOTION, moves, captures_only)
+        enemy = self.occupied[color ^ 1]
+        attacks = PAWN_ATTACKS[color]
+        for from_sq in iter_bits(pawns):
+            for to_sq in iter_bits(attacks[from_sq] & enemy):
+                if (1 << to_sq) & last_row:
+                    self._add_promotions(from_sq, to_sq, PROMOTION | CAPTURE, moves, captures_only)
+                else:
+                    moves.append(encode_move(from_sq, to_sq, CAPTURE))
+        if self.ep_square is not None:
+            # Our pawns that attack the skipped square are exactly the ones a
+            # pawn of the other color on that square would attack
+            for from_sq in iter_bits(PAWN_ATTACKS[color ^ 1][self.ep_square] & pawns):
+                moves.append(encode_move(from_sq, self.ep_square, EP_CAPTURE))
+
+    @staticmethod
+    def _add_promotions(from_sq, to_sq, flags, moves, queen_only=False):
+        for piece in ((QUEEN,) if queen_only else (QUEEN, ROOK, BISHOP, KNIGHT)):
+            moves.append(encode_move(from_sq, to_sq, flags | (piece - KNIGHT)))
+
+    def _castling_moves(self, color, moves):
+        if self.castling == 0:
+            return
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        row = 7 if color == WHITE else 0
+        king_sq = square(row, 4)
+        kingside, queenside = (WHITE_KINGSIDE, WHITE_QUEENSIDE) if color == WHITE else (BLACK_KINGSIDE, BLACK_QUEENSIDE)
+        enemy = color ^ 1
+        if (self.castling & kingside and not occupied & (3 << (king_sq + 1))
+                and not self.is_attacked(king_sq, enemy) and not self.is_attacked(king_sq + 1, enemy)):
+            moves.append(encode_move(king_sq, king_sq + 2, KING_CASTLE))
+        if (self.castling & queenside and not occupied & (7 << (king_sq - 3))
+                and not self.is_attacked(king_sq, enemy) and not self.is_attacked(king_sq - 1, enemy)):
+            moves.append(encode_move(king_sq, king_sq - 2, QUEEN_CASTLE))
+
+    def _piece_moves(self, color, piece_type, pieces, moves, captures_only=False):
+        own = self.occupied[color]
+        enemy = self.occupied[color ^ 1]
+        for from_sq in iter_bits(pieces):
+            if piece_type == KNIGHT:
+                targets = KNIGHT_ATTACKS[from_sq]
+            elif piece_type == KING:
+                targets = KING_ATTACKS[from_sq]
+            else:
+                occupied = own | enemy
+                if piece_type == BISHOP:
+                    targets = bishop_attacks(from_sq, occupied)
+                elif piece_type == ROOK:
+                    targets = rook_attacks(from_sq, occupied)
+                else:
+                    targets = bishop_attacks(from_sq, occupied) | rook_attacks(from_sq, occupied)
+            targets &= ~own
+            for to_sq in iter_bits(targets & enemy):
+                moves.append(encode_move(from_sq, to_sq, CAPTURE))
+            if not captures_only:
+                for to_sq in iter_bits(targets & ~enemy):
+                    moves.append(encode_move(from_sq, to_sq))
+
+    def pseudo_moves(self):
+        color = self.side
+        pieces = self.bitboards[color]
+        moves = []
+        self._pawn_moves(color, pieces[PAWN], moves)
+        for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            if pieces[piece_type]:
+                self._piece_moves(color, piece_type, pieces[piece_type], moves)
+        self._castling_moves(color, moves)
+        return moves
+
+    def capture_moves(self):
+        """Pseudo-legal captures and queen promotions, for quiescence search"""
+        color = self.side
+        pieces = self.bitboards[color]
+        moves = []
+        self._pawn_moves(color, pieces[PAWN], moves, True)
+        for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            if pieces[piece_type]:
+                self._piece_moves(color, piece_type, pieces[piece_type], moves, True)
+        return moves
+
+    def attackers_to(self, sq, occupied):
+        """Pieces of both colors attacking sq, with occupied as the blockers"""
+        white, black = self.bitboards
+        return ((PAWN_ATTACKS[BLACK][sq] & white[PAWN]) | (PAWN_ATTACKS[WHITE][sq] & black[PAWN])
+                | (KNIGHT_ATTACKS[sq] & (white[KNIGHT] | black[KNIGHT]))
+                | (KING_ATTACKS[sq] & (white[KING] | black[KING]))
+                | (bishop_attacks(sq, occupied) & (white[BISHOP] | black[BISHOP] | white[QUEEN] | black[QUEEN]))
+                | (rook_attacks(sq, occupied) & (white[ROOK] | black[ROOK] | white[QUEEN] | black[QUEEN])))
+
+    def see(self, move):
+        """Static exchange evaluation: material the mover expects to win on the
+        target square if both sides keep recapturing with their cheapest piece"""
+        from_sq, to_sq, flags = move & 63, (move >> 6) & 63, move >> 12
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        if flags == EP_CAPTURE:
+            gains = [PIECE_VALUES[PAWN]]
+            occupied ^= 1 << (to_sq + 8 if self.side == WHITE else to_sq - 8)
+        else:
+            victim = self.squares[to_sq]
+            gains = [PIECE_VALUES[victim[1]] if victim else 0]
+        piece_type = self.squares[from_sq][1]
+        occupied ^= 1 << from_sq
+        side = self.side ^ 1
+        while True:
+            attackers = self.attackers_to(to_sq, occupied) & occupied & self.occupied[side]
+            if not attackers:
+                break
+            for attacker_type in range(6):
+                candidates = attackers & self.bitboards[side][attacker_type]
+                if candidates:
+                    break
+            # The piece standing on the square gets captured next
+            gains.append(PIECE_VALUES[piece_type] - gains[-1])
+            piece_type = attacker_type
+            occupied ^= candidates & -candidates
+            side ^= 1
+        while len(gains) > 1:
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0]
+
+    def in_check(self, color=None):
+        """Check if the king of the given color (default: side to move) is attacked"""
+        if color is None:
+            color = self.side
+        king_sq = self.king_square(color)
+        if king_sq is None:
+            return False
+        return self.is_attacked(king_sq, color ^ 1)
+
+    def is_legal(self, move):
+        """A pseudo-legal move is legal if it doesn't leave the mover's king in check"""
+        color = self.side
+        self.make_move(move)
+        legal = not self.in_check(color)
+        self.unmake_move()
+        return legal
+
+    def _filter_legal(self, moves):
+        """Keep legal moves, only testing the ones that could expose the king
+
+        When not in check, a move can only leave the king attacked if the king
+        itself moves, the piece moves off a line through the king (a possible
+        pin), or it is an en passant capture removing two pieces from a rank.
+        """
+        king_sq = self.king_squares[self.side]
+        if king_sq is None:
+            return moves
+        if self.in_check():
+            return [move for move in moves if self.is_legal(move)]
+        lines = QUEEN_LINES[king_sq]
+        legal = []
+        for move in moves:
+            from_sq = move & 63
+            if (from_sq == king_sq or (1 << from_sq) & lines or move >> 12 == EP_CAPTURE) \
+                    and not self.is_legal(move):
+                continue
+            legal.append(move)
+        return legal
+
+    def legal_moves(self):
+        return self._filter_legal(self.pseudo_moves())
+
+    def cached_legal_moves(self):
+        """legal_moves as a tuple, generated once per position key and kept in a small LRU
+
+        For the GUI, game-end checks and the search root, which ask about the
+        same few positions over and over; the search proper generates afresh.
+        """
+        cache = self._legal_cache
+        moves = cache.get(self.key)
+        if moves is None:
+            moves = cache[self.key] = tuple(self.legal_moves())
+            if len(cache) > LEGAL_MOVE_CACHE_SIZE:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(self.key)
+        return moves
+
+    def legal_moves_from(self, row, col):
+        sq = square(row, col)
+        piece = self.squares[sq]
+        if piece is None or piece[0] != self.side:
+            return []
+        return [move for move in self.cached_legal_moves() if move & 63 == sq]
+
+    def make_move(self, move):
+        """Play a move in place, pushing everything needed to take it back"""
+        from_sq, to_sq, flags = move & 63, (move >> 6) & 63, move >> 12
+        color = self.side
+        piece_type = self.squares[from_sq][1]
+        key = self.key
+        self.key ^= self._ep_key() ^ ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_WHITE_TO_MOVE
+        captured = None
+        if flags == EP_CAPTURE:
+            captured_sq = to_sq + 8 if color == WHITE else to_sq - 8
+            captured = self.squares[captured_sq]
+            self.remove_piece(captured_sq)
+        elif flags & CAPTURE:
+            captured = self.squares[to_sq]
+            self.remove_piece(to_sq)
+        self._undo.append((move, piece_type, captured, self.castling, self.ep_square, self.halfmove, key))
+
+        self.remove_piece(from_sq)
+        self.put_piece(to_sq, color, KNIGHT + (flags & 3) if flags & PROMOTION else piece_type)
+        if flags == KING_CASTLE:
+            self.remove_piece(to_sq + 1)
+            self.put_piece(to_sq - 1, color, ROOK)
+        elif flags == QUEEN_CASTLE:
+            self.remove_piece(to_sq - 2)
+            self.put_piece(to_sq + 1, color, ROOK)
+
+        self.castling &= CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq]
+        self.ep_square = (from_sq + to_sq) >> 1 if flags == DOUBLE_PUSH else None
+        self.halfmove = 0 if piece_type == PAWN or captured else self.halfmove + 1
+        if color == BLACK:
+            self.fullmove += 1
+        self.side = color ^ 1
+        self.key ^= ZOBRIST_CASTLING[self.castling] ^ self._ep_key()
+
+    def unmake_move(self):
+        """Take back the last move made and return it"""
+        move, piece_type, captured, self.castling, self.ep_square, self.halfmove, key = self._undo.pop()
+        from_sq, to_sq, flags = move & 63, (move >> 6) & 63, move >> 12
+        color = self.side ^ 1
+        self.side = color
+        if color == BLACK:
+            self.fullmove -= 1
+
+        if flags == KING_CASTLE:
+            self.remove_piece(to_sq - 1)
+            self.put_piece(to_sq + 1, color, ROOK)
+        elif flags == QUEEN_CASTLE:
+            self.remove_piece(to_sq + 1)
+            self.put_piece(to_sq - 2, color, ROOK)
+        self.remove_piece(to_sq)
+        self.put_piece(from_sq, color, piece_type)
+        if captured is not None:
+            if flags == EP_CAPTURE:
+                to_sq = to_sq + 8 if color == WHITE else to_sq - 8
+            self.put_piece(to_sq, captured[0], captured[1])
+        self.key = key
+        return move
+
+    def make_null_move(self):
+        """Pass the turn, for null-move pruning; take it back with unmake_null_move"""
+        self._undo.append((None, None, None, self.castling, self.ep_square, self.halfmove, self.key))
+        self.key ^= self._ep_key() ^ ZOBRIST_WHITE_TO_MOVE
+        self.ep_square = None
+        self.halfmove += 1
+        self.side ^= 1
+
+    def unmake_null_move(self):
+        _, _, _, self.castling, self.ep_square, self.halfmove, self.key = self._undo.pop()
+        self.side ^= 1
+
+    def is_repetition(self):
+        """Whether this position was seen before in the moves made on it, since the last capture or pawn move"""
+        undo = self._undo
+        for back in range(1, min(self.halfmove, len(undo)) + 1):
+            record = undo[-back]
+            if record[0] is None:
+                return False  # Nothing before a null move is part of the same line
+            if not back & 1 and record[6] == self.key:
+                return True
+        # Then the game the position was set up after
+        prior = self._prior_keys
+        for back in range(len(undo) + 1, min(self.halfmove, len(undo) + len(prior)) + 1):
+            if not back & 1 and prior[len(undo) - back] == self.key:
+                return True
+        return False
+
+    def has_non_pawn_material(self, color=None):
+        """Whether color (default: side to move) has a piece besides king and pawns"""
+        boards = self.bitboards[self.side if color is None else color]
+        return bool(boards[KNIGHT] | boards[BISHOP] | boards[ROOK] | boards[QUEEN])
+
+    def is_checkmate(self, color=None):
+        """Check if the given color (default: side to move) is in checkmate"""
+        if color is None:
+            color = self.side
+        if not self.in_check(color):
+            return False
+        if color != self.side:
+            return False  # The side not to move can't be mated right now
+        return not self.cached_legal_moves()
+
+    def is_stalemate(self):
+        """The side to move has no legal moves but isn't in check"""
+        return not self.in_check() and not self.cached_legal_moves()
+
+    def is_insufficient_material(self):
+        """Neither side can ever mate: bare kings plus at most one minor piece"""
+        minors = 0
+        for color in (WHITE, BLACK):
+            boards = self.bitboards[color]
+            if boards[PAWN] or boards[ROOK] or boards[QUEEN]:
+                return False
+            minors += bin(boards[KNIGHT] | boards[BISHOP]).count('1')
+        return minors <= 1
+
+    def san(self, move):
+        """Standard algebraic notation for a legal move, e.g. Nbd7, exd5, O-O or e8=Q+"""
+        from_sq, to_sq, flags = move & 63, (move >> 6) & 63, move >> 12
+        piece_type = self.squares[from_sq][1]
+        if flags == KING_CASTLE:
+            text = 'O-O'
+        elif flags == QUEEN_CASTLE:
+            text = 'O-O-O'
+        elif piece_type == PAWN:
+            text = square_name(to_sq)
+            if flags & CAPTURE:
+                text = square_name(from_sq)[0] + 'x' + text
+            if flags & PROMOTION:
+                text += '=' + PIECE_LETTERS[promotion_piece(move)].upper()
+        else:
+            # Name the origin file, rank or square when another such piece could go there too
+            rivals = [other & 63 for other in self.cached_legal_moves()
+                      if (other >> 6) & 63 == to_sq and other & 63 != from_sq
+                      and self.squares[other & 63][1] == piece_type]
+            origin = square_name(from_sq)
+            if not rivals:
+                origin = ''
+            elif all(sq % 8 != from_sq % 8 for sq in rivals):
+                origin = origin[0]
+            elif all(sq // 8 != from_sq // 8 for sq in rivals):
+                origin = origin[1]
+            text = (PIECE_LETTERS[piece_type].upper() + origin + ('x' if flags & CAPTURE else '')
+                    + square_name(to_sq))
+        self.make_move(move)
+        if self.in_check():
+            text += '#' if not self.cached_legal_moves() else '+'
+        self.unmake_move()
+        return text
+
+    def evaluate(self):
+        """Tapered material and piece-square score, positive when White is better
+
+        O(1): the middlegame and endgame terms and the game phase are kept up
+        to date by put_piece/remove_piece.
+        """
+        phase = min(self.phase, TOTAL_PHASE)
+        return (self.mg_score * phase + self.eg_score * (TOTAL_PHASE - phase)) // TOTAL_PHASE
+
+
+class TranspositionTable:
+    """Fixed-size table of search results indexed by Zobrist key
+
+    Each bucket has two slots: the first keeps the deepest result stored in
+    the bucket, the second always takes the newest one. An entry is a key
+    word plus a packed data word (score, depth, bound and best move), so the
+    table costs exactly 16 bytes per entry.
+    """
+
+    ENTRY_BYTES = 16
+    SCORE_BIAS = 1 << 31
+
+    def __init__(self, size_mb=DEFAULT_HASH_MB):
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        self.size_mb = size_mb
+        self.buckets = max(1, size_mb * 1024 * 1024 // (2 * self.ENTRY_BYTES))
+        self.keys = array('Q', bytes(16 * self.buckets))
+        self.data = array('Q', bytes(16 * self.buckets))
+
+    def clear(self):
+        self.resize(self.size_mb)
+
+    def probe(self, key):
+        """Return (depth, score, bound, move) for key, or None"""
+        index = (key % self.buckets) << 1
+        if self.keys[index] == key:
+            data = self.data[index]
+        elif self.keys[index + 1] == key:
+            data = self.data[index + 1]
+        else:
+            return None
+        return ((data >> 32) & 0xFF, (data & 0xFFFFFFFF) - self.SCORE_BIAS,
+                (data >> 40) & 3, data >> 42)
+
+    def store(self, key, depth, score, bound, move):
+        index = (key % self.buckets) << 1
+        data = (score + self.SCORE_BIAS) | (depth << 32) | (bound << 40) | ((move or 0) << 42)
+        if depth < (self.data[index] >> 32) & 0xFF and self.keys[index] != key:
+            index += 1  # Shallower than the depth-preferred slot: always-replace slot
+        self.keys[index] = key
+        self.data[index] = data
+
+
+def allocate_time(time_left, increment=0, moves_to_go=None):
+    """Milliseconds to spend on this move given the clock (all in ms)"""
+    budget = time_left / (moves_to_go or DEFAULT_MOVES_TO_GO) + increment * 3 // 4
+    return max(1, int(min(budget, time_left - MOVE_OVERHEAD_MS)))
+
+
+def score_to_tt(score, ply):
+    """Mate scores are stored relative to the node, not the root"""
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class SearchStats:
+    """Counters for one search, filled in by the search as it runs
+
+    Safe to read from another thread while the search is going, which is how
+    the GUI shows them live.
+    """
+
+    CUTOFF_BUCKETS = 8  # Cutoff move index histogram: 0..6, then 7 or later
+
+    def __init__(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.evaluations = 0
+        self.beta_cutoffs = 0
+        self.cutoff_index = [0] * self.CUTOFF_BUCKETS
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.bitbase_hits = 0
+        self.depth = 0
+        self.seldepth = 0
+        self.book_move = False
+        self.cache_hit = False
+        self.start_time = time.perf_counter()
+        self.elapsed = 0.0
+
+    def record_cutoff(self, index):
+        self.beta_cutoffs += 1
+        self.cutoff_index[min(index, self.CUTOFF_BUCKETS - 1)] += 1
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.start_time
+
+    def running_time(self):
+        return self.elapsed or time.perf_counter() - self.start_time
+
+    @property
+    def nps(self):
+        return int(self.nodes / max(self.running_time(), 1e-9))
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    @property
+    def first_move_cutoff_rate(self):
+        """How often the first move searched was good enough: a move-ordering score"""
+        return self.cutoff_index[0] / self.beta_cutoffs if self.beta_cutoffs else 0.0
+
+    def snapshot(self):
+        """A frozen copy of the counters so far, e.g. to hand to another process"""
+        copy = SearchStats.__new__(SearchStats)
+        copy.__dict__.update(self.__dict__)
+        copy.cutoff_index = list(self.cutoff_index)
+        copy.elapsed = self.running_time()
+        return copy
+
+    def merge(self, other):
+        """Add another search's counters (from a parallel worker) into this one"""
+        for name in ('nodes', 'qnodes', 'evaluations', 'beta_cutoffs', 'tt_probes', 'tt_hits', 'bitbase_hits'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.cutoff_index = [a + b for a, b in zip(self.cutoff_index, other.cutoff_index)]
+        self.seldepth = max(self.seldepth, other.seldepth)
+
+    def as_dict(self):
+        return {
+            'nodes': self.nodes,
+            'qnodes': self.qnodes,
+            'evaluations': self.evaluations,
+            'beta_cutoffs': self.beta_cutoffs,
+            'cutoff_index': self.cutoff_index,
+            'first_move_cutoff_rate': round(self.first_move_cutoff_rate, 4),
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_hit_rate': round(self.tt_hit_rate, 4),
+            'bitbase_hits': self.bitbase_hits,
+            'depth': self.depth,
+            'seldepth': self.seldepth,
+            'book_move': self.book_move,
+            'cache_hit': self.cache_hit,
+            'elapsed_ms': round(self.running_time() * 1000, 1),
+            'nps': self.nps,
+        }
+
+
+class SearchStopped(Exception):
+    """Raised inside the search when the time budget runs out or stop() is called"""
+
+
+class Engine:
+    """Iterative-deepening alpha-beta search over a Position
+
+    With workers > 1 the root moves are split across a pool of worker
+    processes, each searching its share with its own transposition table.
+    """
+
+    def __init__(self, position=None, hash_mb=DEFAULT_HASH_MB, workers=1):
+        self.position = position if position is not None else Position.start()
+        self.tt = TranspositionTable(hash_mb)
+        self.workers = workers
+        self.book = None  # Optional opening book (see book.OpeningBook), consulted before searching
+        self.cache = None  # Optional persistent analysis cache (see cache.AnalysisCache)
+        self.bitbases = None  # Optional endgame tables (see bitbase.Bitbases), probed at every node
+        self.on_iteration = None  # Optional callback(depth, score, move) after each completed depth
+        # Selective search switches (see SEARCH_FEATURES)
+        self.null_move = True
+        self.late_move_reductions = True
+        self.aspiration_windows = True
+        self.stats = SearchStats()
+        self.completed_depth = 0
+        self.iterations = []  # (depth, score, best_move) for each completed iteration
+        self._root_pv = None  # Line from the worker whose move a parallel search picked
+        self.stop_requested = False
+        self.stop_event = None  # Cross-process stop flag, set in pool workers
+        self._deadline = None
+        self._ponder_movetime = None  # Clock held back until ponderhit()
+        self._ponder_timer = None
+        self._root_best = None
+        self._root_moves = None
+        self._root_material = None  # _material() at the root, to tell conversions apart in bitbase probes
+        self._pool = None
+        self._pool_workers = 0
+        self._pool_stop = None
+        self._pool_progress = None  # Workers put (search_id, worker, iteration, stats) here as they deepen
+        self._pool_search_id = 0
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 4096, [0] * 4096]
+
+    @property
+    def nodes(self):
+        return self.stats.nodes
+
+    def stop(self):
+        """Ask a running search (possibly on another thread) to return as soon as it can"""
+        self.stop_requested = True
+        if self._pool_stop is not None:
+            self._pool_stop.set()
+
+    def ponderhit(self):
+        """The expected move was played: start the clock on the running ponder search"""
+        movetime, self._ponder_movetime = self._ponder_movetime, None
+        if movetime is None:
+            return  # Not pondering, or pondering to a fixed depth only
+        self._deadline = time.monotonic() + movetime / 1000
+        if self._pool_stop is not None:
+            # Pool workers never see our deadline, so stop them when it passes
+            self._ponder_timer = threading.Timer(movetime / 1000, self._pool_stop.set)
+            self._ponder_timer.start()
+
+    def close(self):
+        """Shut down the worker pool, if one was started"""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+            self._pool_stop = None
+            self._pool_progress = None
+
+    def search(self, depth=MAX_SEARCH_DEPTH, movetime=None, root_moves=None, ponder=False):
+        """Search the side to move and return (score, best_move)
+
+        Deepens one ply at a time up to depth, stopping early when movetime
+        milliseconds have passed or stop() is called. The result always comes
+        from the deepest fully completed iteration. root_moves restricts the
+        moves considered at the root. With ponder=True the movetime clock
+        only starts once ponderhit() is called.
+        """
+        self.stats = SearchStats()
+        self._root_pv = None
+        self._ponder_movetime = movetime if ponder else None
+        if ponder:
+            movetime = None
+        self._deadline = time.monotonic() + movetime / 1000 if movetime is not None else None
+        if self.book is not None and root_moves is None:
+            move = self.book.choose(self.position)
+            if move is not None:
+                self.stats.book_move = True
+                self.stats.finish()
+                self._ponder_movetime = None  # Answered at once: there is no clock for ponderhit to start
+                self.completed_depth = 0
+                self.iterations = []
+                return 0, move
+        if self.cache is not None and root_moves is None:
+            cached = self._warm_from_cache(depth)
+            if cached is not None:
+                cached_depth, score, move = cached
+                self.stats.cache_hit = True
+                self.stats.depth = self.completed_depth = cached_depth
+                self.stats.finish()
+                self._ponder_movetime = None
+                self.iterations = [cached]
+                return score, move
+
+        if self.workers > 1 and root_moves is None:
+            result = self._parallel_search(depth, movetime)
+        else:
+            result = self._iterative_deepening(depth, root_moves)
+        self.stats.finish()
+        self._ponder_movetime = None
+        if self._ponder_timer is not None:
+            self._ponder_timer.cancel()
+            self._ponder_timer = None
+        if self.cache is not None and root_moves is None and result[1] is not None:
+            self.cache.store(self.position.key, self.completed_depth, result[0], result[1])
+        return result
+
+    def _warm_from_cache(self, depth):
+        """Load the root and its children from the persistent cache into the
+        transposition table; return the root entry if it is already deep enough"""
+        pos = self.position
+        moves = pos.cached_legal_moves()
+        keys = [pos.key]
+        for move in moves:
+            pos.make_move(move)
+            keys.append(pos.key)
+            pos.unmake_move()
+        found = self.cache.lookup_many(keys)
+        for key, (entry_depth, score, move) in found.items():
+            self.tt.store(key, entry_depth, score, EXACT, move)
+        root = found.get(pos.key)
+        if root is not None and root[0] >= depth and root[2] in moves:
+            return root
+        return None
+
+    def principal_variation(self, max_length=MAX_PLY):
+        """The expected line from the root: the last best move, then the table's moves"""
+        pos = self.position
+        line = []
+        move = self.iterations[-1][2] if self.iterations else None
+        if self._root_pv and self._root_pv[0] == move:
+            return self._root_pv[:max_length]  # Our own table only knows the root
+        try:
+            seen = set()
+            while move and len(line) < max_length and pos.key not in seen and move in pos.legal_moves():
+                seen.add(pos.key)
+                line.append(move)
+                pos.make_move(move)
+                entry = self.tt.probe(pos.key)
+                move = entry[3] if entry else None
+        finally:
+            for _ in line:
+                pos.unmake_move()
+        return line
+
+    def _iterative_deepening(self, depth, root_moves):
+        self.completed_depth = 0
+        self.iterations = []
+        self.stop_requested = False
+        self._root_best = None
+        self._root_moves = root_moves
+        self._root_material = self._material()
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        for table in self.history:
+            for index, value in enumerate(table):
+                if value:
+                    table[index] = value >> 1  # Age, so old games don't dominate
+
+        best = (0, None)
+        for iteration_depth in range(1, depth + 1):
+            try:
+                score, move = self._search_root(iteration_depth, best[0])
+            except SearchStopped:
+                break
+            best = (score, move)
+            self._root_best = move
+            self.completed_depth = self.stats.depth = iteration_depth
+            self.iterations.append((iteration_depth, score, move))
+            if self.on_iteration is not None:
+                self.on_iteration(iteration_depth, score, move)
+            if move is None or abs(score) > MATE_BOUND:
+                break  # No moves, or a forced mate has been found
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                break
+        return best
+
+    def _search_root(self, depth, last_score):
+        """One iteration, first inside a narrow window around the last score when allowed"""
+        if not self.aspiration_windows or depth < ASPIRATION_MIN_DEPTH or abs(last_score) > MATE_BOUND:
+            return self._negamax(depth, -INFINITY, INFINITY, 0)
+        delta = ASPIRATION_WINDOW
+        alpha, beta = last_score - delta, last_score + delta
+        while True:
+            score, move = self._negamax(depth, alpha, beta, 0)
+            # Outside the window the score is only a bound: widen that side and search again
+            delta *= 4
+            if score <= alpha and alpha > -INFINITY:
+                alpha = score - delta if delta < MATE_BOUND else -INFINITY
+            elif score >= beta and beta < INFINITY:
+                beta = score + delta if delta < MATE_BOUND else INFINITY
+                self._root_best = move
+            else:
+                return score, move
+
+    def _check_stop(self):
+        # The first iteration always finishes so there is a move to play
+        if self.completed_depth and (
+                self.stop_requested
+                or (self._deadline is not None and time.monotonic() >= self._deadline)
+                or (self.stop_event is not None and self.stop_event.is_set())):
+            raise SearchStopped()
+
+    def _get_pool(self):
+        if self._pool is None or self._pool_workers != self.workers:
+            self.close()
+            # Spawned rather than forked: the engine usually shares its process
+            # with other threads (UCI's command reader, the search process's
+            # message loop), and forking those is unsafe
+            context = multiprocessing.get_context('spawn')
+            self._pool_stop = context.Event()
+            self._pool_progress = context.Queue()
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                             initargs=(self._pool_stop, self._pool_progress, self.tt.size_mb))
+            self._pool_workers = self.workers
+        return self._pool
+
+    def _parallel_search(self, depth, movetime):
+        """Split the root moves round-robin across the worker processes"""
+        pos = self.position
+        moves = pos.cached_legal_moves()
+        if len(moves) < 2:
+            return self._iterative_deepening(depth, None)
+        entry = self.tt.probe(pos.key)
+        moves = self._order_moves(moves, entry[3] if entry else 0, 0)
+
+        pool = self._get_pool()
+        self._pool_stop.clear()
+        self.stop_requested = False
+        count = min(self.workers, len(moves))
+        self._pool_search_id += 1
+        search_id = self._pool_search_id
+        fen, history = pos.fen(), pos.history_keys()
+        features = {name: getattr(self, name) for name in SEARCH_FEATURES}
+        bitbase_dir = self.bitbases.directory if self.bitbases is not None else None
+        futures = [pool.submit(_search_root_subset, search_id, i, fen, history, moves[i::count], depth, movetime,
+                               features, bitbase_dir)
+                   for i in range(count)]
+
+        # Each depth is reported as soon as every worker has finished it
+        self.iterations = []
+        progress = [[] for _ in range(count)]
+        worker_stats = [None] * count
+        pending = futures
+        while pending:
+            _, pending = wait(pending, timeout=PROGRESS_POLL_SECONDS)
+            if self._read_progress(search_id, progress, worker_stats):
+                self._merge_worker_stats(worker_stats)
+            while all(len(lines) > len(self.iterations) for lines in progress):
+                self._add_parallel_iteration(progress)
+        results = [future.result() for future in futures]
+
+        # Workers that found a mate stop deepening early; the others only
+        # compare at the deepest iteration every one of them finished
+        self._merge_worker_stats([stats for _, stats in results])
+        finished = [lines for lines, _ in results]
+        unresolved = [lines[-1][0] for lines in finished if abs(lines[-1][1]) <= MATE_BOUND]
+        common_depth = min(unresolved) if unresolved else max(lines[-1][0] for lines in finished)
+        while len(self.iterations) < common_depth:
+            self._add_parallel_iteration(finished)
+        self.completed_depth = self.stats.depth = common_depth
+        _, score, move = self.iterations[-1]
+        self.tt.store(pos.key, common_depth, score_to_tt(score, 0), EXACT, move)
+        return score, move
+
+    def _read_progress(self, search_id, progress, worker_stats):
+        """Collect the iterations and counters workers have reported since last time; True if there were any"""
+        updated = False
+        while True:
+            try:
+                message_id, worker, line, stats = self._pool_progress.get_nowait()
+            except queue.Empty:
+                return updated
+            if message_id == search_id:  # Late reports from an earlier search are dropped
+                progress[worker].append(line)
+                worker_stats[worker] = stats
+                updated = True
+
+    def _merge_worker_stats(self, worker_stats):
+        """Make our counters the sum of the workers' latest ones"""
+        merged = SearchStats()
+        merged.start_time = self.stats.start_time
+        merged.depth = self.stats.depth
+        for stats in worker_stats:
+            if stats is not None:
+                merged.merge(stats)
+        self.stats = merged
+
+    def _add_parallel_iteration(self, lines):
+        """Take the best of the workers' results at the next depth"""
+        iteration_depth = len(self.iterations) + 1
+        # A worker that stopped early on a mate keeps its last result
+        candidates = [worker_lines[min(iteration_depth, len(worker_lines)) - 1] for worker_lines in lines]
+        _, score, move, pv = max(candidates, key=lambda line: line[1])
+        self.iterations.append((iteration_depth, score, move))
+        self._root_pv = pv
+        self.completed_depth = self.stats.depth = iteration_depth
+        if self.on_iteration is not None:
+            self.on_iteration(iteration_depth, score, move)
+
+    def _order_moves(self, moves, tt_move, ply):
+        """Sort moves best-first for alpha-beta"""
+        squares = self.position.squares
+        killers = self.killers[ply] if ply < MAX_PLY else (0, 0)
+        history = self.history[self.position.side]
+        scored = []
+        for move in moves:
+            if move == tt_move:
+                score = HASH_MOVE_SCORE
+            elif move >> 12 & (CAPTURE | PROMOTION):
+                flags = move >> 12
+                victim = squares[(move >> 6) & 63]
+                score = CAPTURE_SCORE + MVV_LVA[victim[1] if victim else PAWN][squares[move & 63][1]]
+                if flags & PROMOTION:
+                    score += PIECE_VALUES[KNIGHT + (flags & 3)]
+            elif move == killers[0]:
+                score = KILLER_SCORE + 1
+            elif move == killers[1]:
+                score = KILLER_SCORE
+            else:
+                score = history[move & 0xFFF]
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    def _record_cutoff(self, move, depth, ply):
+        """Remember a quiet move that caused a beta cutoff"""
+        if move >> 12 & (CAPTURE | PROMOTION):
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        history = self.history[self.position.side]
+        history[move & 0xFFF] = min(HISTORY_LIMIT, history[move & 0xFFF] + depth * depth)
+
+    def _negamax(self, depth, alpha, beta, ply, allow_null=True):
+        stats = self.stats
+        stats.nodes += 1
+        if not stats.nodes & (STOP_CHECK_NODES - 1):
+            self._check_stop()
+        if ply > stats.seldepth:
+            stats.seldepth = ply
+        pos = self.position
+        if ply > 0 and pos.is_repetition():
+            return 0, None  # Going round in circles is a draw
+
+        tt_move = 0
+        stats.tt_probes += 1
+        entry = self.tt.probe(pos.key)
+        if entry is not None:
+            stats.tt_hits += 1
+            entry_depth, score, bound, tt_move = entry
+            if ply > 0 and entry_depth >= depth:
+                score = score_from_tt(score, ply)
+                if (bound == EXACT or (bound == LOWER_BOUND and score >= beta)
+                        or (bound == UPPER_BOUND and score <= alpha)):
+                    return score, tt_move or None
+
+        if self.bitbases is not None and ply > 0:
+            wdl = self.bitbases.probe(pos)
+            # Exact results end the search, except that a win in the root's own
+            # endgame is searched on, to find the mate or a way closer to it
+            if wdl is not None and (not wdl or depth == 0 or self._material() != self._root_material):
+                stats.bitbase_hits += 1
+                return self._bitbase_score(wdl, ply), None
+
+        if depth == 0:
+            return self._quiesce(alpha, beta, ply), None
+
+        in_check = pos.in_check()
+        if (self.null_move and allow_null and ply > 0 and depth >= NULL_MOVE_MIN_DEPTH and not in_check
+                and abs(beta) < MATE_BOUND and pos.has_non_pawn_material()):
+            # Null move: if passing still beats beta, a real move will too. Not
+            # tried without pieces, where passing may be the only good "move"
+            pos.make_null_move()
+            try:
+                score = -self._negamax(depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, ply + 1, False)[0]
+            finally:
+                pos.unmake_null_move()
+            if score >= beta:
+                return beta, None
+
+        # The root is searched once per iteration, so its moves are generated once per search
+        moves = pos.cached_legal_moves() if ply == 0 else pos.legal_moves()
+        if not moves:
+            # Checkmate or stalemate
+            return (-MATE_SCORE + ply if in_check else 0), None
+        if ply == 0:
+            if self._root_moves is not None:
+                moves = [move for move in moves if move in self._root_moves]
+            if self._root_best is not None:
+                tt_move = self._root_best  # Previous iteration's best move goes first
+        moves = self._order_moves(moves, tt_move, ply)
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        reduce_late = self.late_move_reductions and depth >= LMR_MIN_DEPTH and not in_check
+        for index, move in enumerate(moves):
+            pos.make_move(move)
+            try:
+                if (reduce_late and index >= LMR_FULL_DEPTH_MOVES and not move >> 12 & (CAPTURE | PROMOTION)
+                        and not pos.in_check()):
+                    # Late quiet moves rarely matter: try one ply shallower with a null
+                    # window, and only search properly if the move looks better than alpha
+                    score = -self._negamax(depth - 2, -alpha - 1, -alpha, ply + 1)[0]
+                    if score > alpha:
+                        score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)[0]
+                else:
+                    score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)[0]
+            finally:
+                pos.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                stats.record_cutoff(index)
+                self._record_cutoff(move, depth, ply)
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.tt.store(pos.key, depth, score_to_tt(best_score, ply), bound, best_move)
+        return best_score, best_move
+
+    def _material(self):
+        """Changes with every capture and promotion"""
+        pos = self.position
+        return bin(pos.occupied[WHITE] | pos.occupied[BLACK]).count('1'), pos.phase
+
+    def _bitbase_score(self, wdl, ply):
+        """Score for an exact bitbase result; wins are ranked by how near mate they look
+
+        The tables only know win, draw or loss, so to make progress the winner
+        is pointed at the usual goals: more material, pawns further up, and
+        the losing king pushed to the edge with the winning king close by.
+        """
+        pos = self.position
+        if not wdl:
+            return 0
+        if wdl < 0 and pos.in_check() and not pos.legal_moves():
+            return -MATE_SCORE + ply  # Checkmated: a draw would have been a stalemate
+        winner = pos.side if wdl > 0 else pos.side ^ 1
+        loser_row, loser_col = divmod(pos.king_squares[winner ^ 1], 8)
+        winner_row, winner_col = divmod(pos.king_squares[winner], 8)
+        from_centre = max(3 - loser_row, loser_row - 4) + max(3 - loser_col, loser_col - 4)
+        distance = abs(loser_row - winner_row) + abs(loser_col - winner_col)
+        score = BITBASE_WIN + (pos.evaluate() if winner == WHITE else -pos.evaluate())
+        score += 20 * from_centre - 10 * distance - ply
+        pawns = pos.bitboards[winner][PAWN]
+        while pawns:
+            low = pawns & -pawns
+            row = (low.bit_length() - 1) // 8
+            score += 20 * (6 - row if winner == WHITE else row - 1)  # Ranks advanced
+            pawns ^= low
+        return score if wdl > 0 else -score
+
+    def _quiesce(self, alpha, beta, ply):
+        """Search captures (and check evasions) until the position is quiet"""
+        stats = self.stats
+        stats.nodes += 1
+        stats.qnodes += 1
+        if not stats.nodes & (STOP_CHECK_NODES - 1):
+            self._check_stop()
+        if ply > stats.seldepth:
+            stats.seldepth = ply
+        pos = self.position
+
+        if pos.in_check():
+            # No standing pat while in check: every evasion gets a look
+            moves = pos.legal_moves()
+            if not moves:
+                return -MATE_SCORE + ply
+            stand_pat = -INFINITY
+        else:
+            stats.evaluations += 1
+            stand_pat = pos.evaluate()
+            if pos.side == BLACK:
+                stand_pat = -stand_pat
+            if stand_pat >= beta or ply >= MAX_PLY - 1:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            moves = pos._filter_legal(pos.capture_moves())
+
+        squares = pos.squares
+        for index, move in enumerate(self._order_moves(moves, 0, ply)):
+            flags = move >> 12
+            if stand_pat > -INFINITY and not flags & PROMOTION:
+                # Delta pruning: even winning the victim for free can't reach alpha
+                victim = squares[(move >> 6) & 63]
+                if stand_pat + PIECE_VALUES[victim[1] if victim else PAWN] + DELTA_MARGIN <= alpha:
+                    continue
+                # Skip captures that lose material once the exchanges play out
+                if pos.see(move) < 0:
+                    continue
+            pos.make_move(move)
+            try:
+                score = -self._quiesce(-beta, -alpha, ply + 1)
+            finally:
+                pos.unmake_move()
+            if score >= beta:
+                stats.record_cutoff(index)
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+
+# Parallel search workers: each process keeps one Engine (and so one
+# transposition table) alive between searches
+
+_worker_engine = None
+_worker_progress = None
+
+
+def _init_worker(stop_event, progress, hash_mb):
+    global _worker_engine, _worker_progress
+    _worker_engine = Engine(hash_mb=hash_mb)
+    _worker_engine.stop_event = stop_event
+    _worker_progress = progress
+
+
+def _search_root_subset(search_id, worker, fen, history, root_moves, depth, movetime, features, bitbase_dir):
+    """Search some of the root moves; returns ([(depth, score, move, pv)], stats)"""
+    engine = _worker_engine
+    engine.position = Position.from_fen(fen, history)
+    for name, enabled in features.items():
+        setattr(engine, name, enabled)
+    if bitbase_dir != getattr(engine.bitbases, 'directory', None):
+        from bitbase import Bitbases
+        engine.bitbases = Bitbases(bitbase_dir) if bitbase_dir else None
+    lines = []
+
+    def report(iteration_depth, score, move):
+        lines.append((iteration_depth, score, move, engine.principal_variation()))
+        _worker_progress.put((search_id, worker, lines[-1], engine.stats.snapshot()))
+
+    engine.on_iteration = report
+    engine.search(depth, movetime, root_moves=root_moves)
+    return lines, engine.stats
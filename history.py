@@ -0,0 +1,178 @@
+"""Game history as packed arrays: undo, replay to any ply, and PGN/FEN export.
+
+The game's moves are kept as 16-bit ints, next to the 64-bit position key
+before each and who played it; taking a move back is left to the
+Position's own undo records. A saved game is the starting FEN plus the raw
+move and who-played arrays, so reloading it is one read and a replay of
+make_move.
+"""
+
+import sys
+from array import array
+from itertools import chain
+
+from engine import WHITE, Position, START_FEN
+
+PGN_LINE_WIDTH = 80
+SEVEN_TAG_ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+
+class GameHistory:
+    """The moves of one game, kept in step with the Position they were played on
+
+    Plies after the current one survive an undo, so the game can be stepped
+    forward again until a different move is played from that point.
+    """
+
+    def __init__(self, position=None):
+        self.position = position if position is not None else Position.start()
+        self.start_fen = self.position.fen()
+        self.moves = array('H')
+        self.keys = array('Q')  # Position key before each move
+        self.by_ai = array('B')
+        self.ply = 0  # Plies currently played on the position; moves may hold more
+
+    def __len__(self):
+        return self.ply
+
+    def push(self, move, by_ai=False):
+        """Play a move, dropping any undone plies unless it is the next one of them"""
+        if self.ply < len(self.moves) and self.moves[self.ply] == move:
+            self.by_ai[self.ply] = by_ai
+        else:
+            for column in (self.moves, self.keys, self.by_ai):
+                del column[self.ply:]
+            self.moves.append(move)
+            self.keys.append(self.position.key)
+            self.by_ai.append(by_ai)
+        self.position.make_move(move)
+        self.ply += 1
+
+    def pop(self):
+        """Take back the last move (it stays available to redo); returns it, or None"""
+        if not self.ply:
+            return None
+        self.position.unmake_move()
+        self.ply -= 1
+        return self.moves[self.ply]
+
+    def redo(self):
+        """Replay the next undone move; returns it, or None"""
+        if self.ply == len(self.moves):
+            return None
+        move = self.moves[self.ply]
+        self.position.make_move(move)
+        self.ply += 1
+        return move
+
+    def goto(self, ply):
+        """Step back or forward through the recorded game to ply"""
+        ply = max(0, min(ply, len(self.moves)))
+        while self.ply > ply:
+            self.pop()
+        while self.ply < ply:
+            self.redo()
+
+    def last(self):
+        """(move, by_ai) of the last move played, or None"""
+        if not self.ply:
+            return None
+        return self.moves[self.ply - 1], bool(self.by_ai[self.ply - 1])
+
+    def repetitions(self):
+        """How many times the current position has occurred, counting now"""
+        key = self.position.key
+        count = 1
+        # Nothing before the last capture or pawn move can repeat
+        for ply in range(self.ply - 2, max(-1, self.ply - 1 - self.position.halfmove), -2):
+            if self.keys[ply] == key:
+                count += 1
+        return count
+
+    def replay(self):
+        """Yield (position, move) before each played move, on a fresh copy of the game"""
+        position = Position.from_fen(self.start_fen)
+        for move in self.moves[:self.ply]:
+            yield position, move
+            position.make_move(move)
+
+    def fens(self):
+        """FEN after each played move"""
+        for position, move in self.replay():
+            position.make_move(move)
+            yield position.fen()
+            position.unmake_move()
+
+    def write_pgn(self, out, headers, result='*'):
+        """Write the game to a text file as PGN, one movetext line at a time"""
+        # The seven standard tags come first, in their standard order
+        tags = {name: '?' for name in SEVEN_TAG_ROSTER}
+        tags.update(headers)
+        tags['Result'] = result
+        if self.start_fen != START_FEN:
+            tags.update(SetUp='1', FEN=self.start_fen)
+        for name, value in tags.items():
+            out.write(f'[{name} "{value}"]\n')
+        out.write('\n')
+        row = ''
+        fullmove = int(self.start_fen.split()[5])
+        black_first = self.start_fen.split()[1] == 'b'
+        for token in chain(self._movetext_tokens(fullmove, black_first), [result]):
+            if row and len(row) + 1 + len(token) > PGN_LINE_WIDTH:
+                out.write(row + '\n')
+                row = token
+            else:
+                row = f'{row} {token}' if row else token
+        out.write(row + '\n\n')
+
+    def _movetext_tokens(self, fullmove, black_first):
+        for ply, (position, move) in enumerate(self.replay()):
+            white_to_move = (ply % 2 == 0) != black_first
+            if white_to_move:
+                yield f'{fullmove}.'
+            elif ply == 0:
+                yield f'{fullmove}...'
+            yield position.san(move)
+            if not white_to_move:
+                fullmove += 1
+
+    def save(self, path):
+        """Starting FEN on the first line, then the played moves as raw 16-bit little-endian ints
+        and a byte per move saying whether the AI played it"""
+        moves = self.moves[:self.ply]
+        if sys.byteorder == 'big':
+            moves.byteswap()
+        with open(path, 'wb') as f:
+            f.write(self.start_fen.encode('ascii') + b'\n')
+            f.write(moves.tobytes())
+            f.write(self.by_ai[:self.ply].tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            fen = f.readline().decode('ascii').strip()
+            data = f.read()
+        plies = len(data) // 3
+        moves = array('H', data[:2 * plies])
+        if sys.byteorder == 'big':
+            moves.byteswap()
+        history = cls(Position.from_fen(fen))
+        for move, by_ai in zip(moves, data[2 * plies:]):
+            history.push(move, by_ai=bool(by_ai))
+        return history
+
+
+def game_over(history):
+    """(result, reason) once the game has ended, else None"""
+    position = history.position
+    if not position.cached_legal_moves():
+        if position.in_check():
+            return ('0-1' if position.side == WHITE else '1-0'), 'checkmate'
+        return '1/2-1/2', 'stalemate'
+    if history.repetitions() >= 3:
+        return '1/2-1/2', 'threefold repetition'
+    if position.halfmove >= 100:
+        return '1/2-1/2', 'fifty-move rule'
+    if position.is_insufficient_material():
+        return '1/2-1/2', 'insufficient material'
+    return None
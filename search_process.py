@@ -0,0 +1,135 @@
+"""An Engine running in its own process, driven over queues.
+
+The GUI sends a FEN snapshot of the position, with the keys of the game
+positions before it so repetitions still count, and gets progress and the
+result back as messages. Its own board is never touched by the search and
+the render loop never competes with the search for the GIL. The child
+keeps one Engine for its whole life, so the transposition table carries
+over from move to move (and from a ponder search to the real one).
+
+Replies are tuples tagged with the id start() returned:
+
+    ('progress', id, stats)                      every PROGRESS_INTERVAL seconds
+    ('done', id, score, move, pv, stats)         when the search has finished
+"""
+
+import multiprocessing
+import queue
+import threading
+
+from engine import DEFAULT_HASH_MB, Engine, Position
+
+PROGRESS_INTERVAL = 0.1  # Seconds between live stats updates while searching
+
+
+class SearchProcess:
+    """Owns the child process and its two queues"""
+
+    def __init__(self, workers=1, hash_mb=DEFAULT_HASH_MB, book=None, cache=None, bitbases=None):
+        # Spawned rather than forked: the GUI process has pygame and threads running
+        context = multiprocessing.get_context('spawn')
+        self.requests = context.Queue()
+        self.replies = context.Queue()
+        self.next_id = 0
+        # Not a daemon: with workers > 1 the child starts a process pool of its own
+        self.process = context.Process(target=_serve, name='search',
+                                       args=(self.requests, self.replies, workers, hash_mb, book, cache, bitbases))
+        self.process.start()
+
+    def start(self, position, depth, movetime=None, ponder=False):
+        """Search a snapshot of position; returns the id its replies will carry"""
+        self.next_id += 1
+        self.requests.put(('search', self.next_id, position.fen(), position.history_keys(), depth, movetime, ponder))
+        return self.next_id
+
+    def stop(self):
+        """Make the running search report its best move so far"""
+        self.requests.put(('stop',))
+
+    def ponderhit(self):
+        self.requests.put(('ponderhit',))
+
+    def poll(self):
+        """Every reply that has arrived, without waiting"""
+        replies = []
+        while True:
+            try:
+                replies.append(self.replies.get_nowait())
+            except queue.Empty:
+                return replies
+
+    def close(self):
+        self.requests.put(('quit',))
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+def _serve(requests, replies, workers, hash_mb, book_path, cache_path, bitbase_dir):
+    """Child process: commands are read here while a second thread runs the searches"""
+    engine = Engine(hash_mb=hash_mb, workers=workers)
+    if book_path:
+        from book import OpeningBook
+        engine.book = OpeningBook(book_path)
+    if cache_path:
+        from cache import AnalysisCache
+        engine.cache = AnalysisCache(cache_path)
+    if bitbase_dir:
+        from bitbase import Bitbases
+        engine.bitbases = Bitbases(bitbase_dir)
+    # Cleared when a search arrives and set by stop, in message order, so a
+    # stop sent right after a search can't be lost however late that search starts
+    engine.stop_event = threading.Event()
+    jobs = queue.Queue()
+    current = [None]  # Id of the search in progress
+
+    def run_searches():
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            search_id, fen, history, depth, movetime, ponder = job
+            engine.position = Position.from_fen(fen, history)
+            current[0] = search_id
+            score, move = engine.search(depth, movetime, ponder=ponder)
+            current[0] = None
+            replies.put(('done', search_id, score, move, engine.principal_variation(), engine.stats.snapshot()))
+
+    runner = threading.Thread(target=run_searches)
+    runner.start()
+    while True:
+        try:
+            message = requests.get(timeout=PROGRESS_INTERVAL)
+        except queue.Empty:
+            search_id = current[0]
+            if search_id is not None:
+                replies.put(('progress', search_id, engine.stats.snapshot()))
+            continue
+        command = message[0]
+        if command == 'search':
+            engine.stop_event.clear()
+            jobs.put(message[1:])
+        elif command == 'stop':
+            while True:  # Searches that haven't started yet are simply dropped
+                try:
+                    jobs.get_nowait()
+                except queue.Empty:
+                    break
+            engine.stop_event.set()
+            engine.stop()
+        elif command == 'ponderhit':
+            engine.ponderhit()
+        elif command == 'quit':
+            break
+
+    engine.stop_event.set()
+    engine.stop()
+    jobs.put(None)
+    runner.join()
+    engine.close()
+    if engine.book is not None:
+        engine.book.close()
+    if engine.cache is not None:
+        engine.cache.close()
+    if engine.bitbases is not None:
+        engine.bitbases.close()
@@ -0,0 +1,345 @@
+"""Headless game server: many human-vs-AI games in one process, over JSON lines.
+
+    python server.py --port 8765 --workers 4
+    python server.py --workers 8 --budget 300000 --report 10
+
+Clients connect over TCP and send one JSON object per line. Every request
+gets one JSON line back, carrying the request's "id" if it had one; replies
+are sent as soon as each request is done, so they may come out of order.
+
+    {"op": "new", "color": "black", "depth": 8}   -> {"ok": true, "game": 1, "move": "e2e4", "fen": ...}
+    {"op": "move", "game": 1, "move": "e7e5"}     -> {"ok": true, "move": "g1f3", "score": 35, "fen": ...}
+    {"op": "state", "game": 1}                    -> {"ok": true, "fen": ..., "moves": [...], "budget_ms": ...}
+    {"op": "close", "game": 1}
+    {"op": "stats"}                               -> games, queue depth and move latency percentiles
+
+"new" also takes "fen" and "budget_ms". Replies about a game carry its
+"status": null while it goes on, else {"result": "1-0", "reason": "checkmate"}.
+
+Games are kept as GameHistory objects and belong to the connection that
+created them. The AI's searches run on a bounded process pool; each game
+has its own budget of thinking time, and waiting searches are handed out
+round-robin across connections, so a client with hundreds of games can't
+starve one with a single game.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import (BLACK, DEFAULT_HASH_MB, MAX_SEARCH_DEPTH, WHITE, Engine, Position, allocate_time,
+                    move_to_uci, parse_move)
+from history import GameHistory, game_over
+
+DEFAULT_PORT = 8765
+DEFAULT_BUDGET_MS = 120000  # AI thinking time per game, spread over its moves
+DEFAULT_MAX_GAMES = 1000
+LATENCY_WINDOW = 10000  # Most recent AI moves the latency percentiles are taken over
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class RequestError(Exception):
+    """A request that can't be carried out; its message goes back to the client"""
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an ascending list, or None if it is empty"""
+    if not ordered:
+        return None
+    return ordered[max(0, min(len(ordered), math.ceil(pct / 100 * len(ordered))) - 1)]
+
+
+class Game:
+    """One game: its moves, the colour the AI plays and the AI's remaining thinking time"""
+
+    def __init__(self, game_id, owner, history, ai_color, depth, budget_ms):
+        self.id = game_id
+        self.owner = owner
+        self.history = history
+        self.ai_color = ai_color
+        self.depth = depth
+        self.budget_ms = budget_ms
+        self.searching = False
+
+
+class FairQueue:
+    """Waiting searches, served round-robin across owners and in order within each"""
+
+    def __init__(self):
+        self.queues = OrderedDict()  # owner -> deque of items, next owner to serve first
+        self.size = 0
+        self._available = asyncio.Semaphore(0)
+
+    def __len__(self):
+        return self.size
+
+    def put(self, owner, item):
+        queue = self.queues.get(owner)
+        if queue is None:
+            queue = self.queues[owner] = deque()
+        queue.append(item)
+        self.size += 1
+        self._available.release()
+
+    async def get(self):
+        await self._available.acquire()
+        owner, queue = next(iter(self.queues.items()))
+        item = queue.popleft()
+        if queue:
+            self.queues.move_to_end(owner)
+        else:
+            del self.queues[owner]
+        self.size -= 1
+        return item
+
+
+_worker_engine = None
+
+
+def _init_worker(hash_mb, book_path, bitbase_dir):
+    global _worker_engine
+    _worker_engine = Engine(hash_mb=hash_mb)
+    if book_path:
+        from book import OpeningBook
+        _worker_engine.book = OpeningBook(book_path)
+    if bitbase_dir:
+        from bitbase import Bitbases
+        _worker_engine.bitbases = Bitbases(bitbase_dir)
+
+
+def _search(fen, history, depth, movetime):
+    """One AI move: (score, move, milliseconds spent thinking)"""
+    _worker_engine.position = Position.from_fen(fen, history)
+    score, move = _worker_engine.search(depth, movetime)
+    return score, move, _worker_engine.stats.elapsed * 1000
+
+
+class GameServer:
+    """Holds the games, answers clients and feeds the search pool"""
+
+    def __init__(self, workers, budget_ms=DEFAULT_BUDGET_MS, hash_mb=DEFAULT_HASH_MB, book=None,
+                 max_games=DEFAULT_MAX_GAMES, bitbases=None):
+        self.workers = workers
+        self.budget_ms = budget_ms
+        self.max_games = max_games
+        self.games = {}
+        self.next_game = 0
+        self.next_client = 0
+        self.queue = FairQueue()
+        self.in_flight = 0
+        self.searches = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # ms from queueing a search to its move
+        self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker, initargs=(hash_mb, book, bitbases))
+        self.ops = {
+            'new': self.op_new,
+            'move': self.op_move,
+            'state': self.op_state,
+            'close': self.op_close,
+            'stats': self.op_stats,
+        }
+
+    async def run(self, host, port, report=None):
+        """Serve until cancelled, printing stats every report seconds if given"""
+        # One dispatcher per pool worker keeps the pool busy but never over-committed
+        dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self.serve_client, host, port)
+        print(f'serving games on {host}:{port} with {self.workers} search processes')
+        try:
+            async with server:
+                if report:
+                    while True:
+                        await asyncio.sleep(report)
+                        print(json.dumps(self.stats()))
+                else:
+                    await server.serve_forever()
+        finally:
+            for task in dispatchers:
+                task.cancel()
+            self.pool.shutdown(cancel_futures=True)
+
+    async def serve_client(self, reader, writer):
+        """One connection: each request line runs as its own task"""
+        self.next_client += 1
+        owner = self.next_client
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._answer(owner, line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            # The client has finished sending: answer what it already asked
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            for game_id in [game.id for game in self.games.values() if game.owner == owner]:
+                del self.games[game_id]
+            writer.close()
+
+    async def _answer(self, owner, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError('expected a JSON object')
+            request_id = request.get('id')
+            handler = self.ops.get(request.get('op'))
+            if handler is None:
+                raise RequestError(f'unknown op {request.get("op")!r} (expected one of {", ".join(self.ops)})')
+            reply = {'ok': True, **await handler(owner, request)}
+        except (RequestError, ValueError, TypeError) as error:
+            reply = {'ok': False, 'error': str(error)}
+        if request_id is not None:
+            reply['id'] = request_id
+        writer.write(json.dumps(reply).encode() + b'\n')
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def _game(self, owner, request):
+        game = self.games.get(request.get('game'))
+        if game is None or game.owner != owner:
+            raise RequestError(f'no such game: {request.get("game")!r}')
+        return game
+
+    def _describe(self, game, **extra):
+        outcome = game_over(game.history)
+        status = {'result': outcome[0], 'reason': outcome[1]} if outcome else None
+        return {'game': game.id, 'fen': game.history.position.fen(), 'status': status, **extra}
+
+    async def op_new(self, owner, request):
+        if len(self.games) >= self.max_games:
+            raise RequestError('server is full')
+        color = request.get('color', 'white')
+        if color not in ('white', 'black'):
+            raise RequestError('color must be "white" or "black"')
+        try:
+            position = Position.from_fen(request['fen']) if 'fen' in request else Position.start()
+        except (ValueError, IndexError, KeyError, AttributeError):
+            raise RequestError(f'bad fen: {request["fen"]}')
+        depth = max(1, min(MAX_SEARCH_DEPTH, int(request.get('depth', MAX_SEARCH_DEPTH))))
+        budget_ms = max(0, min(self.budget_ms, int(request.get('budget_ms', self.budget_ms))))
+        self.next_game += 1
+        game = Game(self.next_game, owner, GameHistory(position), BLACK if color == 'white' else WHITE,
+                    depth, budget_ms)
+        self.games[game.id] = game
+        if position.side == game.ai_color and game_over(game.history) is None:
+            move, score = await self.ai_reply(game)
+            return self._describe(game, move=move_to_uci(move), score=score)
+        return self._describe(game)
+
+    async def op_move(self, owner, request):
+        game = self._game(owner, request)
+        history = game.history
+        if game.searching or history.position.side == game.ai_color:
+            raise RequestError("it is the AI's turn")
+        if game_over(history) is not None:
+            raise RequestError('the game is over')
+        move = parse_move(history.position, str(request.get('move')))
+        if move is None:
+            raise RequestError(f'illegal move: {request.get("move")!r}')
+        history.push(move)
+        if game_over(history) is not None:
+            return self._describe(game)
+        move, score = await self.ai_reply(game)
+        return self._describe(game, move=move_to_uci(move), score=score)
+
+    async def op_state(self, owner, request):
+        game = self._game(owner, request)
+        moves = [move_to_uci(move) for move in game.history.moves[:game.history.ply]]
+        return self._describe(game, moves=moves, budget_ms=round(game.budget_ms), thinking=game.searching)
+
+    async def op_close(self, owner, request):
+        del self.games[self._game(owner, request).id]
+        return {}
+
+    async def op_stats(self, owner, request):
+        return self.stats()
+
+    async def ai_reply(self, game):
+        """Queue a search for the AI's move in game, play it and return (move, score)"""
+        future = asyncio.get_running_loop().create_future()
+        game.searching = True
+        try:
+            self.queue.put(game.owner, (game, future, time.perf_counter()))
+            move, score = await future
+        finally:
+            game.searching = False
+        game.history.push(move, by_ai=True)
+        return move, score
+
+    async def _dispatch(self):
+        """Hand waiting searches to the pool, one at a time"""
+        loop = asyncio.get_running_loop()
+        while True:
+            game, future, queued = await self.queue.get()
+            if future.done():
+                continue  # Its client went away while it waited
+            if self.games.get(game.id) is not game:
+                future.set_exception(RequestError('the game was closed'))
+                continue
+            movetime = allocate_time(game.budget_ms)
+            self.in_flight += 1
+            try:
+                position = game.history.position
+                score, move, spent_ms = await loop.run_in_executor(
+                    self.pool, _search, position.fen(), position.history_keys(), game.depth, movetime)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(RequestError(f'search failed: {error}'))
+                continue
+            finally:
+                self.in_flight -= 1
+            game.budget_ms = max(0, game.budget_ms - spent_ms)
+            self.searches += 1
+            self.latencies.append(round((time.perf_counter() - queued) * 1000, 1))
+            if future.done():
+                continue
+            if self.games.get(game.id) is not game:
+                future.set_exception(RequestError('the game was closed'))
+            else:
+                future.set_result((move, score))
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            'games': len(self.games),
+            'queued': len(self.queue),
+            'searching': self.in_flight,
+            'searches': self.searches,
+            'latency_ms': {f'p{pct}': percentile(latencies, pct) for pct in LATENCY_PERCENTILES},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve many human-vs-AI games over a JSON-lines socket')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='search processes')
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET_MS, metavar='MS',
+                        help='AI thinking time per game')
+    parser.add_argument('--hash', type=int, default=DEFAULT_HASH_MB, help='transposition table MB per process')
+    parser.add_argument('--book', metavar='PATH', help='Polyglot opening book for the AI')
+    parser.add_argument('--bitbases', metavar='DIR', help='endgame bitbases built by bitbase.py')
+    parser.add_argument('--max-games', type=int, default=DEFAULT_MAX_GAMES)
+    parser.add_argument('--report', type=float, metavar='SECONDS', help='print server stats this often')
+    args = parser.parse_args()
+    server = GameServer(args.workers, args.budget, args.hash, args.book, args.max_games, args.bitbases)
+    try:
+        asyncio.run(server.run(args.host, args.port, args.report))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Headless self-play matches between two engine configurations.
+
+    python tournament.py --games 100 --a depth=3 --b depth=4 --pgn match.pgn
+    python tournament.py --games 40 --a movetime=200 --b movetime=400 --concurrency 4
+    python tournament.py --games 100 --a depth=4 --b depth=4,lmr=0
+
+Games are played in a pool of worker processes and each one is appended to
+the PGN file as soon as it finishes, so memory stays flat however long the
+match. Every opening is played twice with colours swapped.
+"""
+
+import argparse
+import io
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from engine import DEFAULT_HASH_MB, MAX_SEARCH_DEPTH, WHITE, Engine, Position
+from history import GameHistory, game_over
+
+DEFAULT_DEPTH = 3  # When a side gives neither depth nor movetime
+MAX_PLIES = 400  # Adjudicate a draw after this many plies
+OPENING_PLIES = 4  # Random plies played before the engines take over
+CONFIG_KEYS = ('depth', 'movetime', 'hash', 'nullmove', 'lmr', 'aspiration')
+# Settings that switch an Engine search feature on (1) or off (0)
+FEATURE_KEYS = {'nullmove': 'null_move', 'lmr': 'late_move_reductions', 'aspiration': 'aspiration_windows'}
+
+
+def parse_config(text):
+    """'depth=3,movetime=200' -> {'depth': 3, 'movetime': 200}"""
+    config = {}
+    for item in filter(None, text.split(',')):
+        name, _, value = item.partition('=')
+        if name not in CONFIG_KEYS:
+            raise ValueError(f'unknown setting {name!r} (expected one of {", ".join(CONFIG_KEYS)})')
+        config[name] = int(value)
+    return config
+
+
+def describe(config):
+    return ','.join(f'{name}={value}' for name, value in config.items()) or f'depth={DEFAULT_DEPTH}'
+
+
+def random_opening(seed, plies=OPENING_PLIES):
+    """A reproducible line of random legal moves to start a pair of games from"""
+    rng = random.Random(seed)
+    position = Position.start()
+    line = []
+    for _ in range(plies):
+        moves = position.legal_moves()
+        if not moves:
+            break
+        move = rng.choice(moves)
+        line.append(move)
+        position.make_move(move)
+    return line
+
+
+def play_game(index, configs, opening, max_plies=MAX_PLIES):
+    """Play one game, configs[0] as White; returns its result, PGN and per-side search totals"""
+    history = GameHistory()
+    position = history.position
+    engines = [Engine(position, hash_mb=config.get('hash', DEFAULT_HASH_MB)) for config in configs]
+    for engine, config in zip(engines, configs):
+        for key, feature in FEATURE_KEYS.items():
+            if key in config:
+                setattr(engine, feature, bool(config[key]))
+    nodes, elapsed = [0, 0], [0.0, 0.0]
+    outcome = None
+    for ply in range(max_plies):
+        outcome = game_over(history)
+        if outcome is not None:
+            break
+        side = position.side
+        if ply < len(opening):
+            move = opening[ply]
+        else:
+            config = configs[side]
+            depth = config.get('depth', MAX_SEARCH_DEPTH if 'movetime' in config else DEFAULT_DEPTH)
+            _, move = engines[side].search(depth, config.get('movetime'))
+            nodes[side] += engines[side].stats.nodes
+            elapsed[side] += engines[side].stats.elapsed
+        history.push(move)
+    else:
+        outcome = game_over(history) or ('1/2-1/2', 'move limit')
+    result, reason = outcome
+
+    headers = {
+        'Event': 'Self-play match',
+        'Site': '?',
+        'Date': time.strftime('%Y.%m.%d'),
+        'Round': index + 1,
+        'White': describe(configs[0]),
+        'Black': describe(configs[1]),
+        'Termination': reason,
+    }
+    pgn = io.StringIO()
+    history.write_pgn(pgn, headers, result)
+    return {'index': index, 'result': result, 'reason': reason, 'pgn': pgn.getvalue(),
+            'nodes': nodes, 'elapsed': elapsed}
+
+
+def _elo(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_difference(wins, draws, losses):
+    """Elo difference and its 95% error margin, from one side's wins, draws and losses"""
+    games = wins + draws + losses
+    if not games:
+        return 0.0, math.inf
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return _elo(score), (_elo(min(1, score + margin)) - _elo(max(0, score - margin))) / 2
+
+
+def run_match(config_a, config_b, games, concurrency, pgn_path=None, seed=0, max_plies=MAX_PLIES):
+    """Play games between A and B, A taking White in even-numbered games; returns (wins, draws, losses) for A"""
+    wins = draws = losses = 0
+    nodes, elapsed = [0, 0], [0.0, 0.0]  # Indexed A, B
+    pgn = open(pgn_path, 'a') if pgn_path else None
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(concurrency, mp_context=context) as pool:
+            pending = set()
+            next_game = 0
+            while next_game < games or pending:
+                # Keep only a couple of games per worker in flight
+                while next_game < games and len(pending) < 2 * concurrency:
+                    configs = (config_a, config_b) if next_game % 2 == 0 else (config_b, config_a)
+                    opening = random_opening(seed * 100003 + next_game // 2)
+                    pending.add(pool.submit(play_game, next_game, configs, opening, max_plies))
+                    next_game += 1
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    game = future.result()
+                    a_side = game['index'] % 2  # Colour A played: 0 = White
+                    for side in (WHITE, 1 - WHITE):
+                        player = 0 if side == a_side else 1
+                        nodes[player] += game['nodes'][side]
+                        elapsed[player] += game['elapsed'][side]
+                    if game['result'] == '1/2-1/2':
+                        draws += 1
+                    elif (game['result'] == '1-0') == (a_side == WHITE):
+                        wins += 1
+                    else:
+                        losses += 1
+                    if pgn is not None:
+                        pgn.write(game['pgn'])
+                        pgn.flush()
+                    print(f'game {wins + draws + losses}/{games} (round {game["index"] + 1}): '
+                          f'{game["result"]} by {game["reason"]}   A: +{wins} ={draws} -{losses}')
+    finally:
+        if pgn is not None:
+            pgn.close()
+
+    elo, margin = elo_difference(wins, draws, losses)
+    print(f'A ({describe(config_a)}) vs B ({describe(config_b)}): +{wins} ={draws} -{losses}')
+    print(f'Elo difference (A - B): {elo:+.1f} +/- {margin:.1f}')
+    for name, player in (('A', 0), ('B', 1)):
+        print(f'{name} average NPS: {nodes[player] / max(elapsed[player], 1e-9):.0f}')
+    return wins, draws, losses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Self-play match between two engine configurations')
+    parser.add_argument('--a', type=parse_config, default={}, metavar='SETTINGS',
+                        help='first engine, e.g. depth=3 or movetime=200,hash=32')
+    parser.add_argument('--b', type=parse_config, default={}, metavar='SETTINGS', help='second engine')
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=os.cpu_count() or 1, help='games played at once')
+    parser.add_argument('--pgn', metavar='PATH', help='append every finished game to this PGN file')
+    parser.add_argument('--seed', type=int, default=0, help='picks the random openings')
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES, help='adjudicate a draw after this many plies')
+    args = parser.parse_args()
+    run_match(args.a, args.b, args.games, args.concurrency, args.pgn, args.seed, args.max_plies)
+
+
+if __name__ == '__main__':
+    main()
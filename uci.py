@@ -0,0 +1,208 @@
+"""Universal Chess Interface front-end, for match runners and chess GUIs.
+
+    python uci.py                 # or: python chess_game.py --uci
+
+Commands are read from stdin on the main thread while searches run on a
+background thread, so `stop`, `isready` and `ponderhit` are answered even
+in the middle of a long search.
+"""
+
+import sys
+import threading
+
+from engine import (DEFAULT_HASH_MB, MATE_BOUND, MATE_SCORE, MAX_SEARCH_DEPTH, START_FEN, WHITE,
+                    Engine, Position, allocate_time, move_to_uci, parse_move)
+
+ENGINE_NAME = 'Funny Chess'
+ENGINE_AUTHOR = 'the Funny Chess authors'
+MAX_HASH_MB = 4096
+MAX_THREADS = 64
+# Check options switching an Engine search feature
+FEATURE_OPTIONS = {'NullMove': 'null_move', 'LateMoveReductions': 'late_move_reductions',
+                   'AspirationWindows': 'aspiration_windows'}
+
+
+def format_score(score):
+    """UCI score: centipawns, or moves to mate (negative when being mated)"""
+    if score > MATE_BOUND:
+        return f'mate {(MATE_SCORE - score + 1) // 2}'
+    if score < -MATE_BOUND:
+        return f'mate -{(MATE_SCORE + score) // 2}'
+    return f'cp {score}'
+
+
+class UCI:
+    """One UCI session: parses commands and runs searches on a background thread"""
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.engine = Engine()
+        self.engine.on_iteration = self.send_info
+        self.position = Position.start()
+        self.search_thread = None
+        self._output_lock = threading.Lock()
+        self._release = threading.Event()  # Lets an infinite/ponder search report its move
+
+    def send(self, line):
+        with self._output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def run(self, lines=sys.stdin):
+        """Answer commands until quit or end of input"""
+        for line in lines:
+            if not self.handle(line):
+                break
+        self.stop_search()
+        self.engine.close()
+
+    def handle(self, line):
+        """Process one command line; returns False on quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'quit':
+            return False
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send(f'id author {ENGINE_AUTHOR}')
+            self.send(f'option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}')
+            self.send(f'option name Threads type spin default 1 min 1 max {MAX_THREADS}')
+            self.send('option name Ponder type check default false')
+            self.send('option name BitbasePath type string default <empty>')
+            for option, feature in FEATURE_OPTIONS.items():
+                default = 'true' if getattr(self.engine, feature) else 'false'
+                self.send(f'option name {option} type check default {default}')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.engine.tt.clear()
+        elif command == 'position':
+            self.set_position(args)
+        elif command == 'go':
+            self.go(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            self.engine.ponderhit()
+            self._release.set()
+        return True
+
+    def set_option(self, args):
+        """setoption name <id> [value <x>]"""
+        if 'name' not in args:
+            return
+        value_at = args.index('value') if 'value' in args else len(args)
+        name = ' '.join(args[args.index('name') + 1:value_at]).lower()
+        value = ' '.join(args[value_at + 1:])
+        self.stop_search()
+        try:
+            if name == 'hash':
+                self.engine.tt.resize(max(1, min(MAX_HASH_MB, int(value))))
+                self.engine.close()  # Pool workers size their tables when they start
+            elif name == 'threads':
+                self.engine.workers = max(1, min(MAX_THREADS, int(value)))
+            elif name == 'bitbasepath':
+                if self.engine.bitbases is not None:
+                    self.engine.bitbases.close()
+                    self.engine.bitbases = None
+                if value and value != '<empty>':
+                    from bitbase import Bitbases
+                    self.engine.bitbases = Bitbases(value)
+            else:
+                for option, feature in FEATURE_OPTIONS.items():
+                    if name == option.lower():
+                        setattr(self.engine, feature, value.lower() == 'true')
+        except (ValueError, OSError):
+            self.send(f'info string bad value for {name}: {value}')
+
+    def set_position(self, args):
+        """position startpos|fen <fen> [moves <m1> ...]"""
+        self.stop_search()
+        moves_at = args.index('moves') if 'moves' in args else len(args)
+        if args and args[0] == 'fen':
+            fen = ' '.join(args[1:moves_at])
+        else:
+            fen = START_FEN
+        try:
+            position = Position.from_fen(fen)
+        except (ValueError, IndexError, KeyError):
+            self.send(f'info string bad fen: {fen}')
+            return
+        for text in args[moves_at + 1:]:
+            move = parse_move(position, text)
+            if move is None:
+                self.send(f'info string illegal move: {text}')
+                break
+            position.make_move(move)
+        self.position = position
+
+    def go(self, args):
+        """go [depth N] [movetime N] [wtime N btime N winc N binc N movestogo N] [infinite] [ponder]"""
+        self.stop_search()
+        params = {}
+        for name, value in zip(args, args[1:]):
+            if name in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo'):
+                try:
+                    params[name] = int(value)
+                except ValueError:
+                    pass
+        infinite, ponder = 'infinite' in args, 'ponder' in args
+
+        depth = params.get('depth', MAX_SEARCH_DEPTH)
+        movetime = params.get('movetime')
+        white = self.position.side == WHITE
+        clock = params.get('wtime' if white else 'btime')
+        if movetime is None and clock is not None and not infinite:
+            movetime = allocate_time(clock, params.get('winc' if white else 'binc', 0), params.get('movestogo'))
+
+        # Rebuilt by every position command, so the search can have it, moves and all
+        self.engine.position = self.position
+        self._release.clear()
+        if not (infinite or ponder):
+            self._release.set()
+        self.search_thread = threading.Thread(target=self._search, args=(depth, movetime, ponder), daemon=True)
+        self.search_thread.start()
+
+    def _search(self, depth, movetime, ponder):
+        score, move = self.engine.search(depth, movetime, ponder=ponder)
+        # Infinite and ponder searches may not answer before stop or ponderhit
+        self._release.wait()
+        if move is None:
+            self.send('bestmove 0000')
+            return
+        line = self.engine.principal_variation(2)
+        if len(line) > 1 and line[0] == move:
+            self.send(f'bestmove {move_to_uci(move)} ponder {move_to_uci(line[1])}')
+        else:
+            self.send(f'bestmove {move_to_uci(move)}')
+
+    def send_info(self, depth, score, move):
+        """Engine.on_iteration callback: one info line per completed depth"""
+        stats = self.engine.stats
+        pv = ' '.join(move_to_uci(m) for m in self.engine.principal_variation())
+        self.send(f'info depth {depth} seldepth {stats.seldepth} score {format_score(score)} '
+                  f'nodes {stats.nodes} nps {stats.nps} tbhits {stats.bitbase_hits} '
+                  f'time {int(stats.running_time() * 1000)} pv {pv}')
+
+    def stop_search(self):
+        """Stop any running search and wait for its bestmove"""
+        if self.search_thread is not None:
+            self._release.set()
+            while self.search_thread.is_alive():  # Repeat in case the search hadn't started yet
+                self.engine.stop()
+                self.search_thread.join(0.05)
+        self.search_thread = None
+
+
+def main():
+    UCI().run()
+
+
+if __name__ == '__main__':
+    main()